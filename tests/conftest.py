@@ -0,0 +1,14 @@
+import os
+import sys
+import types
+
+TESTS = os.path.dirname(__file__)
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.join(TESTS, "..", "tools"))
+
+# The tools import the user's my_secrets.py, which is not part of the repo
+if "my_secrets" not in sys.modules:
+    try:
+        import my_secrets  # noqa: F401
+    except ImportError:
+        sys.modules["my_secrets"] = types.SimpleNamespace(HA_HOST="127.0.0.1", HA_PORT=8123, HA_TOKEN="token")
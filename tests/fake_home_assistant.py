@@ -0,0 +1,110 @@
+"""
+fake_home_assistant.py
+
+A minimal fake of the Home Assistant WebSocket API, for running the tools offline.
+
+It authenticates any token, answers registry requests from the areas it is given, and renders
+templates by echoing them, tracking every sensor entity id they mention. Templates containing
+"warning" are preceded by a WARNING level error event and templates containing "fail" render as an
+ERROR level error event, like render_template with report_errors. Replies to unsubscribe_events are
+delayed by unsubscribe_delay seconds. With coalesce_messages enabled, the render_template reply
+and events are sent in a single frame.
+"""
+import asyncio
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+ENTITY_ID = re.compile(r"sensor\.\w+")
+
+
+class FakeHomeAssistant:
+    def __init__(self, areas: Optional[Dict[str, str]] = None, unsubscribe_delay: float = 0.0):
+        """
+        Initialize the fake server.
+        :param areas: Area names keyed on area id
+        :param unsubscribe_delay: Seconds to wait before replying to unsubscribe_events
+        """
+        self.areas = areas or {}
+        self.unsubscribe_delay = unsubscribe_delay
+        self.port: Optional[int] = None
+        self.received: List[Dict[str, Any]] = []
+        self._server = None
+
+    async def __aenter__(self) -> "FakeHomeAssistant":
+        self._server = await websockets.serve(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, websocket, path=None) -> None:
+        await websocket.send(json.dumps({"type": "auth_required"}))
+        auth = json.loads(await websocket.recv())
+        if auth.get("type") != "auth" or not auth.get("access_token"):
+            await websocket.send(json.dumps({"type": "auth_invalid"}))
+            return
+        await websocket.send(json.dumps({"type": "auth_ok"}))
+
+        coalesce = False
+        tasks = []
+        try:
+            async for frame in websocket:
+                message = json.loads(frame)
+                self.received.append(message)
+                if message["type"] == "supported_features":
+                    coalesce = bool(message.get("features", {}).get("coalesce_messages"))
+                    await self._send(websocket, [self._result(message, None)], coalesce)
+                elif message["type"] == "unsubscribe_events":
+                    tasks.append(asyncio.create_task(self._delayed_result(websocket, message, coalesce)))
+                else:
+                    await self._send(websocket, self._replies(message), coalesce)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _replies(self, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if message["type"] == "config/area_registry/list":
+            return [self._result(message, [{"area_id": area_id, "name": name} for area_id, name in self.areas.items()])]
+        if message["type"] != "render_template":
+            return [self._result(message, [])]
+
+        template = message["template"]
+        replies = [self._result(message, None)]
+        if "warning" in template:
+            replies.append(self._event(message, {"error": "Template variable warning", "level": "WARNING"}))
+        if "fail" in template:
+            replies.append(self._event(message, {"error": "Template failed", "level": "ERROR"}))
+        else:
+            entities = sorted(set(ENTITY_ID.findall(template)))
+            replies.append(self._event(message, {
+                "result": template,
+                "listeners": {"all": False, "entities": entities, "domains": [], "time": False},
+            }))
+        return replies
+
+    async def _delayed_result(self, websocket, message: Dict[str, Any], coalesce: bool) -> None:
+        await asyncio.sleep(self.unsubscribe_delay)
+        await self._send(websocket, [self._result(message, None)], coalesce)
+
+    @staticmethod
+    def _result(message: Dict[str, Any], result: Any) -> Dict[str, Any]:
+        return {"id": message["id"], "type": "result", "success": True, "result": result}
+
+    @staticmethod
+    def _event(message: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": message["id"], "type": "event", "event": event}
+
+    @staticmethod
+    async def _send(websocket, messages: List[Dict[str, Any]], coalesce: bool) -> None:
+        if coalesce:
+            await websocket.send(json.dumps(messages))
+        else:
+            for message in messages:
+                await websocket.send(json.dumps(message))
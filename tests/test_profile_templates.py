@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("websockets")
+pytest.importorskip("construct")
+
+from fake_home_assistant import FakeHomeAssistant
+from home_assistant_websocket_client import HomeAssistantWebSocketClient
+from profile_templates import extract_templates, profile_templates
+
+BUILDER_OUTPUT = """\
+type: vertical-stack
+cards:
+  - type: custom:mushroom-template-card
+    entity: plant.gastrum_aloe_vera
+    secondary: >
+      {{ states('sensor.gastrum_aloe_vera_soil_moisture') }}
+      {{ states('sensor.gastrum_aloe_vera_conductivity') }}
+  - type: custom:mushroom-template-card
+    entity: plant.kok_basilika
+    secondary: "{{ states('sensor.kok_basilika_soil_moisture') }} {{ warning }}"
+  - type: custom:mushroom-template-card
+    entity: plant.kok_timjan
+    secondary: "{{ fail() }}"
+"""
+
+
+def run_profile(coalesce_messages, unsubscribe_delay=0.0):
+    cards = extract_templates(BUILDER_OUTPUT.splitlines(keepends=True), "plants.yaml")
+
+    async def run():
+        async with FakeHomeAssistant(areas={"gastrum": "Gästrum"}, unsubscribe_delay=unsubscribe_delay) as server:
+            client = HomeAssistantWebSocketClient("127.0.0.1", server.port, "token",
+                                                  coalesce_messages=coalesce_messages)
+            await client.connect()
+            results = await profile_templates(client, cards, concurrency=2)
+            await client.close()
+            return results
+
+    return {result["card"].split(" ")[1]: result for result in asyncio.run(run())}
+
+
+@pytest.mark.parametrize("coalesce_messages", [False, True])
+def test_profile_templates(coalesce_messages):
+    results = run_profile(coalesce_messages)
+
+    aloe_vera = results["plant.gastrum_aloe_vera"]
+    assert aloe_vera["entities"] == 2
+    assert aloe_vera["errors"] == []
+    assert aloe_vera["output_size"] > 0
+
+    # The warning event is skipped, the result event is used
+    basilika = results["plant.kok_basilika"]
+    assert basilika["entities"] == 1
+    assert basilika["errors"] == []
+
+    timjan = results["plant.kok_timjan"]
+    assert timjan["errors"] == ["secondary: Template failed"]
+
+    # Cards with more entities rank first
+    assert list(results) == ["plant.gastrum_aloe_vera", "plant.kok_basilika", "plant.kok_timjan"]
+
+
+def test_render_time_excludes_unsubscribe():
+    results = run_profile(coalesce_messages=True, unsubscribe_delay=0.5)
+
+    assert all(result["seconds"] < 0.5 for result in results.values())
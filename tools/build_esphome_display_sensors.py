@@ -1,3 +1,4 @@
+import argparse
 import secrets
 from homeassistant_api import Client
 from pprint import pprint
@@ -5,31 +6,65 @@ from collections import defaultdict
 import requests
 import json
 
+from profiling import add_profile_arguments, create_profiler
+from slugs import area_slug
+
 HA_URL = secrets.HA_URL
 HA_TOKEN = secrets.HA_TOKEN
 HEADERS = {"Authorization": f"Bearer {HA_TOKEN}", "Content-Type": "application/json"}
 
 
-def output_esphome_font():
+CAPTION = "Flowers"
+# The frame is drawn by DisplayHelper::renderFrame from esptime, in a format defined by the
+# DisplayHelper library rather than by this script. bold_font therefore keeps the full glyph set
+# the fonts used before, which covers the frame, and only normal_font is reduced to the plant names.
+FRAME_GLYPHS = "!\"%()+=,-_.:°0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZÅÄÖ abcdefghijklmnopqrstuvwxyzåäö"
+
+
+def glyph_string(text):
+    """
+    Return the sorted, unique characters of the given text as a quoted Esphome glyphs value.
+
+    :param text: The text that will be rendered with the font.
     """
-    Print the Esphome font configuration.
+    glyphs = "".join(sorted(set(text)))
+    return '"' + glyphs.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def output_esphome_font(plant_entities):
     """
+    Print the Esphome font configuration, with glyph sets limited to the characters
+    and icons that will actually be rendered for the given plant entities.
+    normal_font and mdi_font are only used by the plant lines, so they are left out
+    when there are no plants, as Esphome rejects an empty glyph set.
+
+    :param plant_entities: All plant entities shown on the display.
+    """
+    names = "".join(plant_entity.state.attributes['friendly_name'] for plant_entity in plant_entities)
+    has_conductivity = any(plant_entity.state.attributes['conductivity_status'] is not None
+                           for plant_entity in plant_entities)
+
     print('font:')
-    print('  - file: "fonts/arial.ttf"')
-    print('    id: normal_font')
-    print('    size: 16')
-    print('    glyphs: "!\"%()+=,-_.:°0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZÅÄÖ abcdefghijklmnopqrstuvwxyzåäö"')
     print('  - file: "fonts/arial-bold.ttf"')
     print('    id: bold_font')
     print('    size: 16')
-    print('    glyphs: "!\"%()+=,-_.:°0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZÅÄÖ abcdefghijklmnopqrstuvwxyzåäö"')
+    print(f'    glyphs: {glyph_string(CAPTION + FRAME_GLYPHS)}')
+    if not names:
+        print()
+        return
+
+    print('  - file: "fonts/arial.ttf"')
+    print('    id: normal_font')
+    print('    size: 16')
+    print(f'    glyphs: {glyph_string(names)}')
     print('  - file: "fonts/materialdesignicons-webfont.ttf"')
     print('    id: mdi_font')
     print("    glyphs: ")
     print('      - "\\U000F058C"  # mdi:water')
     print('      - "\\U000F058D"  # mdi:water-off')
-    print('      - "\\U000F032A"  # mdi:leaf')
-    print('      - "\\U000F12D9"  # mdi:leaf-off")')
+    if has_conductivity:
+        print('      - "\\U000F032A"  # mdi:leaf')
+        print('      - "\\U000F12D9"  # mdi:leaf-off')
     print()
 
 
@@ -69,7 +104,7 @@ def output_esphome_lambda():
     print('    lambda: |-')
     print('      auto index = 0;')
     print('      DisplayHelper::renderFrame(&it, id(bold_font), id(esptime));')
-    print('      DisplayHelper::renderCaption(&it, index++, id(bold_font), "Flowers");')
+    print(f'      DisplayHelper::renderCaption(&it, index++, id(bold_font), "{CAPTION}");')
     print()
 
 
@@ -80,9 +115,117 @@ def output_esphome_lambda_line(plant_entity):
     :param plant_entity: The plant entity to create the lambda function line for.
     """
     if plant_entity.state.attributes['conductivity_status'] is not None:
-        print(f"      DisplayHelper::renderPlantLine(&it, index++, id(normal), id(mdi_font), id({plant_entity.slug}_moisture), id({plant_entity.slug}_conductivity), id({plant_entity.slug}_name));")
+        print(f"      DisplayHelper::renderPlantLine(&it, index++, id(normal_font), id(mdi_font), id({plant_entity.slug}_moisture), id({plant_entity.slug}_conductivity), id({plant_entity.slug}_name));")
     else:
-        print(f"      DisplayHelper::renderMinPlantLine(&it, index++, id(normal), id(mdi_font), id({plant_entity.slug}_moisture), id({plant_entity.slug}_name));")
+        print(f"      DisplayHelper::renderMinPlantLine(&it, index++, id(normal_font), id(mdi_font), id({plant_entity.slug}_moisture), id({plant_entity.slug}_name));")
+
+
+def output_packed_template_sensor(area_name, plant_entities):
+    """
+    Print a Home Assistant template sensor packing the status of all plants in an area into its statuses attribute.
+    Each plant is encoded as two characters, moisture status then conductivity status, using the
+    lowercase first letter of the status ("o" for ok, "l" for Low, "h" for High) or "-" when not available.
+    The packed statuses are kept in an attribute, as Home Assistant limits states to 255 characters,
+    and the state holds the number of plants with a status that is not ok.
+
+    :param area_name: The area the plants belong to.
+    :param plant_entities: The plant entities in the area, in display order.
+    """
+    plant_ids = ", ".join(f"'{plant_entity.entity_id}'" for plant_entity in plant_entities)
+    print(f"      - name: \"Plant status {area_name}\"")
+    print(f"        unique_id: plant_status_{area_slug(area_name)}")
+    print(f"        state: >-")
+    print(f"          {{{{ [{plant_ids}] | select('is_state', 'problem') | list | count }}}}")
+    print(f"        attributes:")
+    print(f"          statuses: >-")
+    print(f"            {{%- for plant in [{plant_ids}] -%}}")
+    print( "            {{ (state_attr(plant, 'moisture_status') or '-')[0] | lower }}{{ (state_attr(plant, 'conductivity_status') or '-')[0] | lower }}")
+    print( "            {%- endfor -%}")
+    print()
+
+
+def packed_sensor_ids(plant_entity):
+    """
+    Return the ids of the local Esphome text sensors decoded from the packed status sensor for the given plant entity.
+
+    :param plant_entity: The plant entity to return the sensor ids for.
+    """
+    sensor_ids = [f"{plant_entity.slug}_moisture"]
+    if plant_entity.state.attributes['conductivity_status'] is not None:
+        sensor_ids.append(f"{plant_entity.slug}_conductivity")
+    sensor_ids.append(f"{plant_entity.slug}_name")
+    return sensor_ids
+
+
+def output_packed_esphome_sensor(area_name, plant_entities):
+    """
+    Print the Esphome text sensor configuration subscribing to the packed status sensor of an area.
+    It is the only sensor subscribed to, the plant sensors decoded from it are updated when it changes.
+
+    :param area_name: The area to create the sensor configuration for.
+    :param plant_entities: The plant entities in the area, in display order.
+    """
+    slug = area_slug(area_name)
+    print(f"  - platform: homeassistant")
+    print(f"    id: {slug}_status")
+    print(f"    entity_id: sensor.plant_status_{slug}")
+    print(f"    attribute: statuses")
+    print(f"    internal: true")
+    print(f"    on_value:")
+    print(f"      then:")
+    for plant_entity in plant_entities:
+        for sensor_id in packed_sensor_ids(plant_entity):
+            print(f"        - component.update: {sensor_id}")
+    print()
+
+
+def output_packed_status_sensor(sensor_id, status_id, position):
+    """
+    Print a local Esphome template text sensor decoding one status character of the packed status sensor.
+
+    :param sensor_id: The id of the template text sensor.
+    :param status_id: The id of the packed status sensor.
+    :param position: The position of the status character in the packed status sensor.
+    """
+    print(f"  - platform: template")
+    print(f"    id: {sensor_id}")
+    print(f"    internal: true")
+    print(f"    update_interval: never")
+    print(f"    lambda: |-")
+    print(f"      auto &packed = id({status_id}).state;")
+    print(f"      if (packed.size() <= {position}) return {{\"\"}};")
+    print(f"      switch (packed[{position}]) {{")
+    print(f"        case 'o': return {{\"ok\"}};")
+    print(f"        case 'l': return {{\"Low\"}};")
+    print(f"        case 'h': return {{\"High\"}};")
+    print(f"        default: return {{\"\"}};")
+    print(f"      }}")
+
+
+def output_packed_esphome_plant_sensors(area_name, plant_entity, position):
+    """
+    Print the local Esphome text sensor configuration for the given plant entity, decoding its status from
+    the packed status sensor of the area. The plant name is resolved at build time, into a constant sensor.
+    The sensors use the same ids as output_esphome_sensor, so the lambda lines are the same.
+
+    :param area_name: The area the plant belongs to.
+    :param plant_entity: The plant entity to create the sensor configuration for.
+    :param position: The position of the plant in the packed status sensor.
+    """
+    status_id = f"{area_slug(area_name)}_status"
+    name = json.dumps(plant_entity.state.attributes['friendly_name'], ensure_ascii=False)
+    print("  # -------------------------------")
+    print(f"  # {plant_entity.state.attributes['friendly_name']}")
+    output_packed_status_sensor(f"{plant_entity.slug}_moisture", status_id, 2 * position)
+    if plant_entity.state.attributes['conductivity_status'] is not None:
+        output_packed_status_sensor(f"{plant_entity.slug}_conductivity", status_id, 2 * position + 1)
+    print(f"  - platform: template")
+    print(f"    id: {plant_entity.slug}_name")
+    print(f"    internal: true")
+    print(f"    update_interval: never")
+    print(f"    lambda: |-")
+    print(f"      return {{{name}}};")
+    print()
 
 
 def get_area_name(entity_name):
@@ -93,37 +236,71 @@ def get_area_name(entity_name):
     area_response = requests.post(f"{HA_URL}/api/template", headers=HEADERS, data=body)
     return area_response.text
 
-def main():
+def main(args):
     """
     Main function for the script.
     Sets up the client connection, and processes plants to output Esphome yaml.
+    With --packed, a Home Assistant template sensor per area is output as well, and the display
+    subscribes to that single sensor instead of two or three sensors per plant. The plant sensors
+    are then local template sensors decoded from it, so the display lambda is the same.
+
+    :param args: Parsed command line arguments.
     """
-    client = Client(f"{secrets.HA_URL}/api", secrets.HA_TOKEN)
-    entities = client.get_entities()
-    plants = entities["plant"]
+    profiler = create_profiler(args)
+    profiler.start()
+    try:
+        with profiler.phase("connect/auth"):
+            client = Client(f"{secrets.HA_URL}/api", secrets.HA_TOKEN)
+        with profiler.phase("state fetch"):
+            entities = client.get_entities()
+        plants = entities["plant"]
+
+        # Sort entities by area
+        with profiler.phase("plant resolution"):
+            plants_by_area = defaultdict(list)
+            for entity_id in plants.entities:
+                area = get_area_name(entity_id)
+                entity = plants.entities[entity_id]
+                plants_by_area[area].append(entity)
+
+        with profiler.phase("render"):
+            output_esphome_font([plant_entity for area_plants in plants_by_area.values() for plant_entity in area_plants])
 
-    # Sort entities by area
-    plants_by_area = defaultdict(list)
-    for entity_id in plants.entities:
-        area = get_area_name(entity_id)
-        entity = plants.entities[entity_id]
-        plants_by_area[area].append(entity)
+            sorted_areas = list(plants_by_area.keys())
+            sorted_areas.sort()
+            if args.packed:
+                print("  # ===============================")
+                print("  # Home Assistant template sensors")
+                print("  # ===============================")
+                print("template:")
+                print("  - sensor:")
+                for area_name in sorted_areas:
+                    output_packed_template_sensor(area_name, plants_by_area[area_name])
 
-    sorted_areas = list(plants_by_area.keys())
-    sorted_areas.sort()
-    for area_name in sorted_areas:
-        print("  # ===============================")
-        print(f"  # CYD setup for {area_name}")
-        print("  # ===============================")
+            for area_name in sorted_areas:
+                print("  # ===============================")
+                print(f"  # CYD setup for {area_name}")
+                print("  # ===============================")
 
-        output_esphome_font()
-        for plant_entity in plants_by_area[area_name]:
-            output_esphome_sensor(plant_entity)
+                if args.packed:
+                    output_packed_esphome_sensor(area_name, plants_by_area[area_name])
+                    for position, plant_entity in enumerate(plants_by_area[area_name]):
+                        output_packed_esphome_plant_sensors(area_name, plant_entity, position)
+                else:
+                    for plant_entity in plants_by_area[area_name]:
+                        output_esphome_sensor(plant_entity)
 
-        output_esphome_lambda()
-        for plant_entity in plants_by_area[area_name]:
-            output_esphome_lambda_line(plant_entity)
+                output_esphome_lambda()
+                for plant_entity in plants_by_area[area_name]:
+                    output_esphome_lambda_line(plant_entity)
+    finally:
+        profiler.stop()
+        profiler.write_report(args.profile)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build ESPHome display sensors for all plants")
+    parser.add_argument("--packed", action="store_true",
+                        help="Pack the plant statuses of each area into a single Home Assistant template sensor")
+    add_profile_arguments(parser)
+    main(parser.parse_args())
\ No newline at end of file
@@ -5,10 +5,13 @@ This script generates a single markdown template for Home Assistant dashboards
 that uses internal Home Assistant functions to enumerate and display plant entities.
 The template groups plants by area and displays their moisture levels and status.
 """
+import argparse
 
-def main() -> None:
+from profiling import add_profile_arguments, create_profiler
+
+
+def output_template() -> None:
     """
-    Main function for the script.
     Outputs a single markdown template that uses Home Assistant's internal functions
     to enumerate plant entities, group them by area, and display their status.
     
@@ -17,9 +20,6 @@ def main() -> None:
     2. Group them by area
     3. Display moisture levels, status, and additional details for each plant
     
-    Args:
-        None
-        
     Returns:
         None
     """
@@ -95,8 +95,32 @@ def main() -> None:
     print("  No plant entities found.")
     print("  {% endif %}")
 
+
+def main(args: argparse.Namespace) -> None:
+    """
+    Main function for the script.
+    Outputs the markdown template, optionally profiling the run.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+    profiler = create_profiler(args)
+    profiler.start()
+    try:
+        with profiler.phase("render"):
+            output_template()
+    finally:
+        profiler.stop()
+        profiler.write_report(args.profile)
+
+
 if __name__ == "__main__":
     """
     Entry point for the script.
     """
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build a markdown card template listing all plants")
+    add_profile_arguments(parser)
+    main(parser.parse_args())
\ No newline at end of file
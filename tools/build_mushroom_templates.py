@@ -1,11 +1,32 @@
+import argparse
 import asyncio
-from typing import List, Dict, Any
+import json
+import sys
+from typing import List, Dict, Any, Optional, Set
 
 import my_secrets
 from home_assistant_websocket_client import HomeAssistantWebSocketClient
+from plant_thumbnails import build_thumbnails
+from profiling import add_profile_arguments, create_profiler
+from slugs import area_label, unique_area_slugs
 
 client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
 
+# Path of the overview view with --views, area views never use it
+OVERVIEW_PATH = "plants"
+
+def yaml_string(value: str) -> str:
+    """
+    Quotes a value for YAML output, so names containing e.g. ": " or "#" are kept as is.
+
+    Args:
+        value (str): The value.
+
+    Returns:
+        str: The value as a double quoted YAML scalar.
+    """
+    return json.dumps(value, ensure_ascii=False)
+
 def output_template_header(plant_entities: List[Dict[str, Any]]) -> None:
     """
     Outputs the header for the plant entities formatted as Esphome YAML.
@@ -19,18 +40,19 @@ def output_template_header(plant_entities: List[Dict[str, Any]]) -> None:
     """
     area_name: str = plant_entities[0]['area_name']
     print(f"============================")
-    print(f"{area_name}")
+    print(f"{area_label(area_name)}")
     print(f"============================")
     print(f"type: vertical-stack")
     print(f"cards:")
 
-async def output_mushroom_template(plant_entity: Dict[str, Any]) -> None:
+async def output_mushroom_template(plant_entity: Dict[str, Any], indent: str = "") -> None:
     """
     Outputs the detailed mushroom-template-card configuration for a plant entity.
 
     Args:
         plant_entity (Dict[str, Any]): A dictionary containing metadata for a single plant entity.
             It should include fields such as 'entity_id', 'name', and so on.
+        indent (str): Prefix for each output line, for cards nested in views or other cards.
 
     Returns:
         None
@@ -38,40 +60,171 @@ async def output_mushroom_template(plant_entity: Dict[str, Any]) -> None:
     entity_id: str = plant_entity['entity_id']
     sensor_name: str = entity_id.split('.')[1]
     moisture_sensor_name: str = 'sensor.' + sensor_name + '_soil_moisture'      
-    print( "  - type: custom:mushroom-template-card")
-    print(f"    entity: {plant_entity['entity_id']}")
-    print(f"    primary: {plant_entity['name']}")
-    print( "    picture: \"{{ state_attr(entity, 'entity_picture') }}\"")
-    print(f"    secondary: >")
+    print(indent + "  - type: custom:mushroom-template-card")
+    print(indent + f"    entity: {plant_entity['entity_id']}")
+    print(indent + f"    primary: {yaml_string(plant_entity['name'])}")
+    print(indent + "    picture: \"{{ state_attr(entity, 'entity_picture') }}\"")
+    print(indent + f"    secondary: >")
 
     # Basic plant, moisture
-    print(f"      {{% set moisture = states('{moisture_sensor_name}') %}}")
-    print( "      {% set moisture_ok = state_attr(entity, 'moisture_status') == 'ok' %}")
-    print( "      {% if moisture_ok %} 💧{% else %} 🩸{% endif %} {{ moisture }}%")
+    print(indent + f"      {{% set moisture = states('{moisture_sensor_name}') %}}")
+    print(indent + "      {% set moisture_ok = state_attr(entity, 'moisture_status') == 'ok' %}")
+    print(indent + "      {% if moisture_ok %} 💧{% else %} 🩸{% endif %} {{ moisture }}%")
 
     # MiFlora sensor
     conductivity_sensor_name: str = 'sensor.' + sensor_name + '_conductivity'
     if await client.entity_attr_exists(conductivity_sensor_name, "external_sensor"):
         conductivity_real_name = await client.get_state_attr(conductivity_sensor_name, 'external_sensor')
         battery_sensor_name = conductivity_real_name.replace('conductivity', 'battery')
-        print(f"      {{% set conductivity = states('{conductivity_sensor_name}') %}}")
-        print( "      {% set conductivity_ok = state_attr(entity, 'conductivity_status') == 'ok' %}")
-        print(f"      {{% set battery = states('{battery_sensor_name}') %}}")
-        print( "      {% set battery_ok = (battery | int > 15) if battery is not none and battery != 'unknown' else false %}")
-        print( "      {% if conductivity_ok %} - 🌿{% else %} - 🌱{% endif %} {{ conductivity }} µS/cm")
-        print( "      {% if battery_ok %} 🔋 {% else %} 🪫 {% endif %} {{ battery }}%")
-
-    print( "      ({{ relative_time(states[entity].last_updated) }})")
-    print( "    badge_icon: |")
-    print( "      {% if is_state_attr(entity, 'moisture_status', 'ok') %} mdi:water {% else %} mdi:water-alert {% endif %}")
-    print( "    badge_color: |")
-    print( "      {% if is_state_attr(entity, 'moisture_status', 'ok') %} green {% else %} red {% endif %}")
-    print( "    features_position: bottom")
-    print( "    grid_options:")
-    print( "      columns: 12")
-    print( "      rows: 1")
-
-async def main() -> None:
+        print(indent + f"      {{% set conductivity = states('{conductivity_sensor_name}') %}}")
+        print(indent + "      {% set conductivity_ok = state_attr(entity, 'conductivity_status') == 'ok' %}")
+        print(indent + f"      {{% set battery = states('{battery_sensor_name}') %}}")
+        print(indent + "      {% set battery_ok = (battery | int > 15) if battery is not none and battery != 'unknown' else false %}")
+        print(indent + "      {% if conductivity_ok %} - 🌿{% else %} - 🌱{% endif %} {{ conductivity }} µS/cm")
+        print(indent + "      {% if battery_ok %} 🔋 {% else %} 🪫 {% endif %} {{ battery }}%")
+
+    print(indent + "      ({{ relative_time(states[entity].last_updated) }})")
+    print(indent + "    badge_icon: |")
+    print(indent + "      {% if is_state_attr(entity, 'moisture_status', 'ok') %} mdi:water {% else %} mdi:water-alert {% endif %}")
+    print(indent + "    badge_color: |")
+    print(indent + "      {% if is_state_attr(entity, 'moisture_status', 'ok') %} green {% else %} red {% endif %}")
+    print(indent + "    features_position: bottom")
+    print(indent + "    grid_options:")
+    print(indent + "      columns: 12")
+    print(indent + "      rows: 1")
+
+def resolve_plant_entity(plant_entity: Dict[str, Any], states: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+    """
+    Resolves the sensor entity ids used by a plant card at build time.
+
+    Args:
+        plant_entity (Dict[str, Any]): A dictionary containing metadata for a single plant entity.
+        states (Dict[str, Dict[str, Any]]): All entity states, keyed on entity id.
+
+    Returns:
+        Dict[str, Optional[str]]: The moisture, conductivity and battery sensor entity ids,
+            None for sensors the plant does not have, and the plant picture URL.
+    """
+    plant_state = states.get(plant_entity['entity_id'], {})
+    sensor_name: str = plant_entity['entity_id'].split('.')[1]
+    conductivity_sensor_name: str = 'sensor.' + sensor_name + '_conductivity'
+    conductivity_state = states.get(conductivity_sensor_name, {})
+    external_sensor = conductivity_state.get('attributes', {}).get('external_sensor')
+
+    battery_sensor_name = None
+    if external_sensor:
+        battery_sensor_name = external_sensor.replace('conductivity', 'battery')
+        if battery_sensor_name not in states:
+            battery_sensor_name = None
+
+    return {
+        'moisture': 'sensor.' + sensor_name + '_soil_moisture',
+        'conductivity': conductivity_sensor_name if external_sensor else None,
+        'battery': battery_sensor_name,
+        'picture': plant_state.get('attributes', {}).get('entity_picture'),
+    }
+
+def output_resolved_mushroom_template(plant_entity: Dict[str, Any], sensors: Dict[str, Optional[str]],
+                                      last_updated: bool = True, indent: str = "") -> Set[str]:
+    """
+    Outputs a mushroom-template-card with all entity ids resolved at build time.
+    Every state and attribute is looked up once, and the card only subscribes to the
+    plant entity and its own sensors.
+
+    Args:
+        plant_entity (Dict[str, Any]): A dictionary containing metadata for a single plant entity.
+        sensors (Dict[str, Optional[str]]): Sensor entity ids as returned by `resolve_plant_entity`.
+        last_updated (bool): Include the relative last updated time. This makes the frontend
+            re-render the card every minute.
+        indent (str): Prefix for each output line, for cards nested in views or other cards.
+
+    Returns:
+        Set[str]: The entity ids the card subscribes to.
+    """
+    entity_id: str = plant_entity['entity_id']
+    picture = sensors['picture']
+    print(indent + "  - type: custom:mushroom-template-card")
+    print(indent + f"    entity: {entity_id}")
+    print(indent + f"    primary: {yaml_string(plant_entity['name'])}")
+    if picture:
+        print(indent + f"    picture: \"{picture}\"")
+    else:
+        print(indent + "    picture: \"{{ state_attr(entity, 'entity_picture') }}\"")
+    print(indent + f"    secondary: >")
+
+    print(indent + f"      {{% set plant = states['{entity_id}'] %}}")
+    print(indent + f"      {{{{ '💧' if plant.attributes.moisture_status == 'ok' else '🩸' }}}} {{{{ states('{sensors['moisture']}') }}}}%")
+    if sensors['conductivity']:
+        print(indent + f"      - {{{{ '🌿' if plant.attributes.conductivity_status == 'ok' else '🌱' }}}} {{{{ states('{sensors['conductivity']}') }}}} µS/cm")
+    if sensors['battery']:
+        print(indent + f"      {{% set battery = states('{sensors['battery']}') %}}")
+        print(indent + "      {{ '🔋' if battery | int(0) > 15 else '🪫' }} {{ battery }}%")
+    if last_updated:
+        print(indent + "      ({{ relative_time(plant.last_updated) }})")
+    print(indent + "    badge_icon: |")
+    print(indent + "      {{ 'mdi:water' if is_state_attr(entity, 'moisture_status', 'ok') else 'mdi:water-alert' }}")
+    print(indent + "    badge_color: |")
+    print(indent + "      {{ 'green' if is_state_attr(entity, 'moisture_status', 'ok') else 'red' }}")
+    print(indent + "    features_position: bottom")
+    print(indent + "    grid_options:")
+    print(indent + "      columns: 12")
+    print(indent + "      rows: 1")
+
+    return {entity_id} | {sensors[key] for key in ('moisture', 'conductivity', 'battery') if sensors[key]}
+
+def output_overview_card(area_name: Optional[str], plant_entities: List[Dict[str, Any]], dashboard_path: str,
+                         view_path: str, indent: str = "") -> None:
+    """
+    Outputs a mushroom-template-card summarizing an area, navigating to the area's view when tapped.
+    The card only subscribes to the plant entities, not to their sensors.
+
+    Args:
+        area_name (Optional[str]): The area name.
+        plant_entities (List[Dict[str, Any]]): The plant entities in the area.
+        dashboard_path (str): The URL path of the dashboard, e.g. "lovelace".
+        view_path (str): The path of the area's view.
+        indent (str): Prefix for each output line, for cards nested in views or other cards.
+
+    Returns:
+        None
+    """
+    plant_ids = ", ".join(f"'{plant_entity['entity_id']}'" for plant_entity in plant_entities)
+    print(indent + "  - type: custom:mushroom-template-card")
+    print(indent + f"    primary: {yaml_string(area_label(area_name))}")
+    print(indent + "    icon: mdi:flower")
+    print(indent + "    secondary: >")
+    print(indent + "      {% set ns = namespace(problems=0) %}")
+    print(indent + f"      {{% for plant in [{plant_ids}] %}}")
+    print(indent + "      {% if is_state(plant, 'problem') %}{% set ns.problems = ns.problems + 1 %}{% endif %}")
+    print(indent + "      {% endfor %}")
+    print(indent + f"      {{{{ ns.problems }}}} of {len(plant_entities)} plants need attention")
+    print(indent + "    icon_color: >")
+    print(indent + "      {% set ns = namespace(problems=0) %}")
+    print(indent + f"      {{% for plant in [{plant_ids}] %}}")
+    print(indent + "      {% if is_state(plant, 'problem') %}{% set ns.problems = ns.problems + 1 %}{% endif %}")
+    print(indent + "      {% endfor %}")
+    print(indent + "      {{ 'red' if ns.problems > 0 else 'green' }}")
+    print(indent + "    tap_action:")
+    print(indent + "      action: navigate")
+    print(indent + f"      navigation_path: /{dashboard_path}/{view_path}")
+
+def output_subscription_report(subscriptions: Dict[str, Set[str]]) -> None:
+    """
+    Prints the number of entities each card subscribes to on stderr, most expensive first.
+
+    Args:
+        subscriptions (Dict[str, Set[str]]): Subscribed entity ids, keyed on card entity id.
+
+    Returns:
+        None
+    """
+    print("Template subscriptions per card:", file=sys.stderr)
+    for entity_id, entities in sorted(subscriptions.items(), key=lambda item: (-len(item[1]), item[0])):
+        print(f"  {len(entities):>3}  {entity_id}", file=sys.stderr)
+    total = sum(len(entities) for entities in subscriptions.values())
+    print(f"  {total:>3}  total for {len(subscriptions)} cards", file=sys.stderr)
+
+async def main(args: argparse.Namespace) -> None:
     """
     Main function for the script.
     Establishes a connection with the Home Assistant WebSocket API,
@@ -80,26 +233,123 @@ async def main() -> None:
     Workflow:
         1. Connects to the Home Assistant WebSocket API using credentials from my_secrets.
         2. Retrieves plant information grouped by area using `get_plants_sorted_on_area`.
-        3. Outputs Esphome YAML configuration for each plant, grouped by its area.
+        3. With --resolved, fetches all states once and resolves the sensors of every plant.
+           With --thumbnails, also creates a thumbnail of every plant picture.
+        4. Outputs Mushroom YAML configuration for each plant, grouped by its area. With --views,
+           as a dashboard with an overview view and a subview per area.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
 
     Returns:
         None
     """
-    await client.connect()
+    profiler = create_profiler(args)
+    client.profiler = profiler
+    profiler.start()
+    try:
+        await client.connect()
+
+        # Get plants, sorted on Area
+        with profiler.phase("plant resolution"):
+            plants = await client.get_plants_sorted_on_area()
+
+            if args.resolved:
+                states = await client.get_states_dict()
+                resolved = {plant_entity['entity_id']: resolve_plant_entity(plant_entity, states)
+                            for area_plants in plants.values() for plant_entity in area_plants}
+
+            if args.thumbnails:
+                with profiler.phase("thumbnails"):
+                    thumbnails = await build_thumbnails(
+                        {entity_id: sensors['picture'] for entity_id, sensors in resolved.items()},
+                        f"http://{my_secrets.HA_HOST}:{my_secrets.HA_PORT}", my_secrets.HA_TOKEN,
+                        args.thumbnails, args.thumbnail_url, size=args.thumbnail_size,
+                        refresh=args.refresh_thumbnails)
+                for entity_id, sensors in resolved.items():
+                    sensors['picture'] = thumbnails.get(entity_id, sensors['picture'])
+
+        subscriptions: Dict[str, Set[str]] = {}
+        with profiler.phase("render"):
+            if args.views:
+                # A dashboard with an overview, and a subview per area
+                view_paths = unique_area_slugs(plants.keys(), reserved=[OVERVIEW_PATH])
+                print("views:")
+                print("  - title: Plants")
+                print(f"    path: {OVERVIEW_PATH}")
+                print("    cards:")
+                print("      - type: vertical-stack")
+                print("        cards:")
+                for key in plants.keys():
+                    output_overview_card(key, plants[key], args.dashboard_path, view_paths[key], indent="        ")
 
-    # Get plants, sorted on Area
-    plants = await client.get_plants_sorted_on_area()
+            for key in plants.keys():
+                # Sort plants in each area alphabetically by name before output
+                sorted_plants = sorted(plants[key], key=lambda p: (p.get('name') or '').lower())
+                indent = ""
+                if args.views:
+                    print(f"  - title: {yaml_string(area_label(key))}")
+                    print(f"    path: {view_paths[key]}")
+                    print( "    subview: true")
+                    print( "    cards:")
+                    print( "      - type: vertical-stack")
+                    print( "        cards:")
+                    print( "          - type: custom:mushroom-title-card")
+                    print(f"            title: {yaml_string(area_label(key))}")
+                    indent = "        "
+                else:
+                    output_template_header(sorted_plants)
+                for plant_entity in sorted_plants:
+                    card_indent = indent
+                    if args.conditional:
+                        # Only shown, and subscribed, while the plant has a problem
+                        print(indent + "  - type: conditional")
+                        print(indent + "    conditions:")
+                        print(indent + "      - condition: state")
+                        print(indent + f"        entity: {plant_entity['entity_id']}")
+                        print(indent + "        state: problem")
+                        print(indent + "    card:")
+                        print(indent + "      type: vertical-stack")
+                        print(indent + "      cards:")
+                        card_indent = indent + "      "
+                    if args.resolved:
+                        entity_id = plant_entity['entity_id']
+                        subscriptions[entity_id] = output_resolved_mushroom_template(
+                            plant_entity, resolved[entity_id], last_updated=not args.no_last_updated, indent=card_indent)
+                    else:
+                        await output_mushroom_template(plant_entity, indent=card_indent)
 
-    for key in plants.keys():
-        # Sort plants in each area alphabetically by name before output
-        sorted_plants = sorted(plants[key], key=lambda p: (p.get('name') or '').lower())
-        output_template_header(sorted_plants)
-        for plant_entity in sorted_plants:
-            await output_mushroom_template(plant_entity)
+        if args.resolved:
+            output_subscription_report(subscriptions)
+    finally:
+        profiler.stop()
+        profiler.write_report(args.profile)
 
 
 if __name__ == "__main__":
     """
     Entry point for the script. Runs the main async logic.
     """
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build Mushroom template cards for all plants")
+    parser.add_argument("--resolved", action="store_true",
+                        help="Resolve all entity ids at build time and emit minimal templates")
+    parser.add_argument("--no-last-updated", action="store_true",
+                        help="Leave out the relative last updated time, which re-renders every card each minute")
+    parser.add_argument("--views", action="store_true",
+                        help="Output a dashboard with an overview and a subview per area")
+    parser.add_argument("--dashboard-path", default="lovelace",
+                        help="URL path of the dashboard, used for navigating from the overview")
+    parser.add_argument("--conditional", action="store_true",
+                        help="Only show the plants that have a problem")
+    parser.add_argument("--thumbnails", metavar="DIR",
+                        help="Create plant picture thumbnails in DIR, served by Home Assistant, requires --resolved")
+    parser.add_argument("--thumbnail-url", default="/local/plant_thumbnails",
+                        help="URL the thumbnail directory is served from")
+    parser.add_argument("--thumbnail-size", type=int, default=128, help="Maximum thumbnail width and height")
+    parser.add_argument("--refresh-thumbnails", action="store_true",
+                        help="Download all pictures again, even if they have a thumbnail")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if args.thumbnails and not args.resolved:
+        parser.error("--thumbnails requires --resolved")
+    asyncio.run(main(args))
\ No newline at end of file
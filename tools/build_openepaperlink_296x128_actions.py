@@ -1,8 +1,10 @@
+import argparse
 import asyncio
 from typing import List, Dict, Any
 
 import my_secrets
 from tools.home_assistant_websocket_client import HomeAssistantWebSocketClient
+from tools.profiling import add_profile_arguments, create_profiler
 
 """
 Script for the Hanshow 296x128 tags
@@ -107,7 +109,7 @@ def output_mushroom_template(plant_entity: Dict[str, Any], index: int) -> None:
     print(f"      anchor: lb")
 
 
-async def main() -> None:
+async def main(args: argparse.Namespace) -> None:
     """
     Main function for the script.
     Establishes a connection with the Home Assistant WebSocket API,
@@ -119,25 +121,36 @@ async def main() -> None:
         3. Outputs Esphome YAML configuration for each plant, grouped by its area.
 
     Args:
-        None
+        args (argparse.Namespace): Parsed command line arguments.
 
     Returns:
         None
     """
+    profiler = create_profiler(args)
     client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
-    await client.connect()
+    client.profiler = profiler
+    profiler.start()
+    try:
+        await client.connect()
 
-    # Get plants, sorted on Area
-    plants = await client.get_plants_sorted_on_area()
+        # Get plants, sorted on Area
+        with profiler.phase("plant resolution"):
+            plants = await client.get_plants_sorted_on_area()
 
-    for key in plants.keys():
-        output_template_header(plants[key])
-        for i, plant_entity in enumerate(plants[key]):
-            output_mushroom_template(plant_entity, i)
+        with profiler.phase("render"):
+            for key in plants.keys():
+                output_template_header(plants[key])
+                for i, plant_entity in enumerate(plants[key]):
+                    output_mushroom_template(plant_entity, i)
+    finally:
+        profiler.stop()
+        profiler.write_report(args.profile)
 
 
 if __name__ == "__main__":
     """
     Entry point for the script. Runs the main async logic.
     """
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build OpenEPaperLink drawcustom actions for 296x128 tags")
+    add_profile_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
\ No newline at end of file
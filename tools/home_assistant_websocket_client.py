@@ -1,6 +1,8 @@
 import asyncio
 import json
-from collections import defaultdict
+import sys
+import time
+from collections import defaultdict, deque
 
 import websockets
 from typing import Dict, List, Optional
@@ -8,22 +10,62 @@ from typing import Dict, List, Optional
 from construct.lib import OrderedDict
 
 from my_secrets import HA_HOST, HA_PORT, HA_TOKEN
+# The client is imported both as a top level module, by the builders run from the tools folder,
+# and as tools.home_assistant_websocket_client, by the OpenEPaperLink builders run from the repo root
+try:
+    from .profiling import Profiler
+except ImportError:
+    from profiling import Profiler
+
+# Short keys used by config/entity_registry/list_for_display, mapped to the
+# field names returned by config/entity_registry/list
+DISPLAY_REGISTRY_KEYS = {
+    "ei": "entity_id",
+    "di": "device_id",
+    "ai": "area_id",
+    "en": "name",
+    "pl": "platform",
+    "lb": "labels",
+    "ic": "icon",
+    "tk": "translation_key",
+    "ec": "entity_category",
+    "hb": "hidden_by",
+    "hn": "has_entity_name",
+}
+
+# Profiling phase for each request type, anything else is recorded as "request"
+MESSAGE_PHASES = {
+    "config/area_registry/list": "registry fetch",
+    "config/device_registry/list": "registry fetch",
+    "config/entity_registry/list": "registry fetch",
+    "config/entity_registry/list_for_display": "registry fetch",
+    "get_states": "state fetch",
+}
 
 
 class HomeAssistantWebSocketClient:
-    def __init__(self, host, port, token):
+    def __init__(self, host, port, token, compact_registry=True, coalesce_messages=True):
         """
         Initialize the Home Assistant WebSocket Client.
         :param host: Hostname or IP address of the Home Assistant instance
         :param port: Port number of the Home Assistant WebSocket API
         :param token: Long-lived access token for authentication
+        :param compact_registry: Use the compact display entity registry for read-only lookups
+        :param coalesce_messages: Let Home Assistant send several messages in a single websocket frame
         """
         self.host = host
         self.port = port
         self.token = token
+        self.compact_registry = compact_registry
+        self.coalesce_messages = coalesce_messages
 
         self.websocket = None
         self.message_id = 0
+        self.profiler = Profiler()
+        self._events = deque()
+        self._pending = {}
+        self._event_waiters = {}
+        self._receive_lock = asyncio.Lock()
 
         self._areas = None
         self._plant_devices = None
@@ -33,25 +75,29 @@ class HomeAssistantWebSocketClient:
         Connect to the Home Assistant WebSocket API.
         """
         uri = f"ws://{self.host}:{self.port}/api/websocket"
-        self.websocket = await websockets.connect(uri, max_size = 100 * 1024 * 1024)
-        # Set up authentication
-        response = await self.websocket.recv()
-        response_json = json.loads(response)
-        if response_json.get("type") == "auth_required":
-            await self.websocket.send(json.dumps({"type": "auth", "access_token": self.token}))
-            auth_response = json.loads(await self.websocket.recv())
-            if auth_response.get("type") != "auth_ok":
-                raise Exception("Authentication failed: " + str(auth_response))
-        print("Connected and authenticated to Home Assistant WebSocket API.")
+        with self.profiler.phase("connect/auth"):
+            self.websocket = await websockets.connect(uri, max_size = 100 * 1024 * 1024)
+            # Set up authentication
+            response = await self.websocket.recv()
+            response_json = json.loads(response)
+            if response_json.get("type") == "auth_required":
+                await self.websocket.send(json.dumps({"type": "auth", "access_token": self.token}))
+                auth_response = json.loads(await self.websocket.recv())
+                if auth_response.get("type") != "auth_ok":
+                    raise Exception("Authentication failed: " + str(auth_response))
+        print("Connected and authenticated to Home Assistant WebSocket API.", file=sys.stderr)
+        if self.coalesce_messages:
+            await self._send_message("supported_features", {"features": {"coalesce_messages": 1}})
         self._areas = await self.get_areas()
         self._plant_devices = await self.get_plant_device_dict()
 
 
-    async def _send_message(self, message_type, payload=None):
+    async def _send_message(self, message_type, payload=None, first_event=None):
         """
         Send a message to the WebSocket API.
         :param message_type: Type of message to send
         :param payload: Additional plant_entity for the message
+        :param first_event: Future receiving the arrival time and first event of a subscription, instead of the event queue
         :return: API response
         """
         if self.websocket is None:
@@ -64,10 +110,61 @@ class HomeAssistantWebSocketClient:
         }
         if payload:
             message.update(payload)
-        await self.websocket.send(json.dumps(message))
+        reply = asyncio.get_running_loop().create_future()
+        self._pending[self.message_id] = reply
+        if first_event is not None:
+            self._event_waiters[self.message_id] = first_event
+        # One phase entry per request, covering both sending it and waiting for the reply
+        with self.profiler.phase(MESSAGE_PHASES.get(message_type, "request")):
+            await self.websocket.send(json.dumps(message))
+
+            # Several requests may be waiting concurrently, one at a time reads and dispatches messages
+            # until its own reply has arrived
+            while not reply.done():
+                async with self._receive_lock:
+                    if not reply.done():
+                        for received in await self._receive_messages(None):
+                            self._dispatch(received)
+        return reply.result()
+
+    def _dispatch(self, message):
+        """
+        Route a received message to the request waiting for it, or to the event queue.
+        Events from subscriptions are kept for receive_event.
+        :param message: The decoded message
+        """
+        if message.get("type") == "event":
+            # Later events of a subscription with an event waiter are dropped, as are warnings
+            # reported by render_template before its result. The waiter receives the time of arrival
+            # along with the event, so waiting for the receive lock is not counted as render time
+            waiter = self._event_waiters.get(message.get("id"))
+            if waiter is not None:
+                event = message["event"]
+                if not waiter.done() and event.get("level", "ERROR") == "ERROR":
+                    waiter.set_result((time.perf_counter(), event))
+            else:
+                self._events.append(message)
+            return
+        reply = self._pending.pop(message.get("id"), None)
+        if reply is not None and not reply.done():
+            reply.set_result(message)
+
+    async def _receive_messages(self, phase="receive"):
+        """
+        Receive and decode the next frame from the WebSocket API.
+        With coalescing enabled a frame may hold a JSON array of several messages.
+        :param phase: Profiling phase to record the wait for the frame in, None when the caller records it
+        :return: The decoded messages
+        """
+        if phase is None:
+            response = await self.websocket.recv()
+        else:
+            with self.profiler.phase(phase):
+                response = await self.websocket.recv()
 
-        response = await self.websocket.recv()
-        return json.loads(response)
+        with self.profiler.phase("decode"):
+            decoded = json.loads(response)
+        return decoded if isinstance(decoded, list) else [decoded]
 
     async def get_areas(self) -> Dict[str, str]:
         """
@@ -80,6 +177,14 @@ class HomeAssistantWebSocketClient:
         areas = { area["area_id"]: area["name"] for area in result }
         return areas
 
+    async def get_area_ids(self) -> Dict[str, str]:
+        """
+        Returns the area ids keyed on area name, from the areas retrieved when connecting.
+
+        :return: A dictionary where keys are area names and values are area IDs.
+        """
+        return {name: area_id for area_id, name in self._areas.items()}
+
     async def get_plant_devices(self) -> List[Dict[str, Optional[str]]]:
         devices =  await self.get_plant_device_dict()
         plant_result = []
@@ -111,12 +216,41 @@ class HomeAssistantWebSocketClient:
         result = defaultdict(list)
         for plant in plants:
             result[plant["area_name"]].append(plant)
-        sorted_result = OrderedDict(sorted(result.items()))
+        # Plants without an area, keyed on None, are sorted last
+        sorted_result = OrderedDict(sorted(result.items(), key=lambda item: (item[0] is None, item[0] or "")))
         return sorted_result
 
-    async def get_entity_config(self, entity_id: str):
+    async def get_entity_registry(self) -> List[Dict]:
+        """
+        Retrieve the entity registry.
+
+        When compact_registry is enabled the compact display registry is used, and its short keys
+        are expanded into the field names of the full registry. Only the fields listed in
+        DISPLAY_REGISTRY_KEYS are available in that case. Falls back to the full registry if the
+        Home Assistant instance does not support the display registry.
+
+        :return: List of entity registry entries
+        """
+        if self.compact_registry:
+            response = await self._send_message("config/entity_registry/list_for_display")
+            if response.get("success", True) and "result" in response:
+                result = response["result"]
+                categories = result.get("entity_categories", {})
+                entities = []
+                for item in result.get("entities", []):
+                    entity = {name: item.get(key) for key, name in DISPLAY_REGISTRY_KEYS.items()}
+                    if entity["entity_category"] is not None:
+                        entity["entity_category"] = categories.get(str(entity["entity_category"]))
+                    # The display registry already resolves name to original_name
+                    entity["original_name"] = entity["name"]
+                    entities.append(entity)
+                return entities
+
         response = await self._send_message("config/entity_registry/list")
-        config = response.get("result", [])
+        return response.get("result", [])
+
+    async def get_entity_config(self, entity_id: str):
+        config = await self.get_entity_registry()
         match = [item for item in config if item["entity_id"] == entity_id]
         if not match:
             return None
@@ -148,15 +282,14 @@ class HomeAssistantWebSocketClient:
         return domain_result
 
     async def get_plant_entities(self):
-        response = await self._send_message("config/entity_registry/list")
-        result = response.get("result", [])
+        result = await self.get_entity_registry()
 
         domain_result = []
         for entity in result:
             if str(entity.get("entity_id")).startswith("plant"):
                 entity_id = str(entity.get("entity_id"))
                 device_id = entity.get("device_id")
-                print(entity_id)
+                print(entity_id, file=sys.stderr)
                 area_id = self._plant_devices[device_id]["area_id"]
                 if area_id in self._areas:
                     area_name = self._areas[area_id]
@@ -165,10 +298,6 @@ class HomeAssistantWebSocketClient:
                 name = entity["name"]
                 # Now get name of underlying sensor
                 moisture_entity = entity_id.replace("plant.", "sensor.") + "_soil_moisture"
-                # Extract external_sensor
-                state = await self.get_state(moisture_entity)
-                external_sensor = state
-                crap = await self.get_entity_config(moisture_entity)
 
                 if name is None:
                     name = entity.get("original_name")
@@ -192,6 +321,16 @@ class HomeAssistantWebSocketClient:
                 domain_result.append(entity)
         return domain_result
 
+    async def get_states_dict(self) -> Dict[str, Dict]:
+        """
+        Retrieve all entity states in a single request.
+
+        :return: A dictionary where keys are entity IDs and values are state objects.
+        """
+        response = await self._send_message("get_states")
+        result = response.get("result", [])
+        return {item["entity_id"]: item for item in result}
+
     async def entity_exists(self, entity_id: str) -> bool:
         """
         Check if an entity exists in Home Assistant.
@@ -217,7 +356,8 @@ class HomeAssistantWebSocketClient:
         Returns:
             bool: True if attribute exists, False otherwise
         """
-        state = await self.get_state(entity_id)
+        with self.profiler.phase("attribute lookup"):
+            state = await self.get_state(entity_id)
         if not state:
             return False
 
@@ -234,7 +374,8 @@ class HomeAssistantWebSocketClient:
         Returns:
             The attribute value if found, None otherwise
         """
-        state = await self.get_state(entity_id)
+        with self.profiler.phase("attribute lookup"):
+            state = await self.get_state(entity_id)
         if not state:
             return None
 
@@ -255,6 +396,75 @@ class HomeAssistantWebSocketClient:
         }
         return await self._send_message("call_service", payload)
 
+    async def update_device(self, device_id: str, **changes):
+        """
+        Update a device in the device registry, e.g. its area_id.
+        :param device_id: The device to update
+        :param changes: The device registry fields to change
+        :return: API response
+        """
+        payload = {"device_id": device_id}
+        payload.update(changes)
+        return await self._send_message("config/device_registry/update", payload)
+
+    async def render_template(self, template: str, variables: Optional[Dict] = None) -> Dict:
+        """
+        Render a template once, using a render_template subscription.
+        :param template: The template to render
+        :param variables: Variables available in the template, e.g. the card's entity
+        :return: The render event, with the output in 'result' and the tracked entities in 'listeners',
+                 or 'error' if the template failed. 'seconds' holds the time from sending the request
+                 to receiving the event, without unsubscribing
+        """
+        payload = {"template": template, "report_errors": True}
+        if variables:
+            payload["variables"] = variables
+        first_event = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        response = await self._send_message("render_template", payload, first_event=first_event)
+        if not response.get("success", False):
+            self._event_waiters.pop(response.get("id"), None)
+            return {"error": str(response.get("error")), "seconds": time.perf_counter() - started}
+
+        while not first_event.done():
+            async with self._receive_lock:
+                if not first_event.done():
+                    for received in await self._receive_messages():
+                        self._dispatch(received)
+
+        received, event = first_event.result()
+        await self._send_message("unsubscribe_events", {"subscription": response["id"]})
+        self._event_waiters.pop(response["id"], None)
+        return dict(event, seconds=received - started)
+
+    async def subscribe_events(self, event_type: Optional[str] = None) -> int:
+        """
+        Subscribe to events, e.g. 'state_changed'. Events are read using receive_event.
+        :param event_type: The event type to subscribe to, or None for all events
+        :return: The subscription id, used as id in the event messages
+        """
+        payload = {"event_type": event_type} if event_type else None
+        response = await self._send_message("subscribe_events", payload)
+        if not response.get("success", False):
+            raise Exception("Subscription failed: " + str(response))
+        return response["id"]
+
+    async def receive_event(self) -> Dict:
+        """
+        Wait for the next event message from a subscription.
+        It is safe to cancel the wait, e.g. using asyncio.wait_for.
+        :return: The event message, with the event itself in the 'event' key
+        """
+        if self.websocket is None:
+            raise Exception("WebSocket connection is not established.")
+
+        while not self._events:
+            async with self._receive_lock:
+                if not self._events:
+                    for received in await self._receive_messages():
+                        self._dispatch(received)
+        return self._events.popleft()
+
     async def close(self):
         """
         Close the WebSocket connection.
@@ -262,7 +472,7 @@ class HomeAssistantWebSocketClient:
         if self.websocket:
             await self.websocket.close()
             self.websocket = None
-            print("WebSocket connection closed.")
+            print("WebSocket connection closed.", file=sys.stderr)
 
 # Example usage
 if __name__ == "__main__":
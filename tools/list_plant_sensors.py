@@ -1,9 +1,11 @@
+import argparse
 import asyncio
 from typing import List, Dict, Any
 from html import escape
 
 import my_secrets
 from home_assistant_websocket_client import HomeAssistantWebSocketClient
+from profiling import add_profile_arguments, create_profiler
 
 client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
 
@@ -24,23 +26,29 @@ async def print_plant_data(plant: Dict[str, Any]) -> str:
     moisture_src = escape(str(moisture_device) if moisture_device is not None else "")
     return f"<tr><td>{entity_id}</td><td>{name}</td><td>{moisture_src}</td></tr>"
 
-async def main() -> None:
+async def main(args: argparse.Namespace) -> None:
     """
     Hämtar växtdata och genererar en HTML-fil med formaterad tabell.
     """
-    await client.connect()
+    profiler = create_profiler(args)
+    client.profiler = profiler
+    profiler.start()
+    try:
+        await client.connect()
 
-    # Hämta växter, grupperade per område
-    plants = await client.get_plants_sorted_on_area()
+        # Hämta växter, grupperade per område
+        with profiler.phase("plant resolution"):
+            plants = await client.get_plants_sorted_on_area()
 
-    rows: List[str] = []
-    for area_name, plant_list in plants.items():
-        rows.append(f"<tr class='area-row'><th colspan='3'>{escape(area_name)}</th></tr>")
-        for plant_entity in plant_list:
-            row_html = await print_plant_data(plant_entity)
-            rows.append(row_html)
+        with profiler.phase("render"):
+            rows: List[str] = []
+            for area_name, plant_list in plants.items():
+                rows.append(f"<tr class='area-row'><th colspan='3'>{escape(area_name)}</th></tr>")
+                for plant_entity in plant_list:
+                    row_html = await print_plant_data(plant_entity)
+                    rows.append(row_html)
 
-    html_doc = f"""<!DOCTYPE html>
+        html_doc = f"""<!DOCTYPE html>
 <html lang="sv">
 <head>
 <meta charset="utf-8">
@@ -69,12 +77,18 @@ caption {{ caption-side: top; text-align: left; font-size: 1.25rem; margin-botto
 </body>
 </html>"""
 
-    with open("plants.html", "w", encoding="utf-8") as f:
-        f.write(html_doc)
+        with profiler.phase("write"):
+            with open("plants.html", "w", encoding="utf-8") as f:
+                f.write(html_doc)
+    finally:
+        profiler.stop()
+        profiler.write_report(args.profile)
 
 if __name__ == "__main__":
     """
     Entry point för skriptet. Kör huvudlogiken (async).
     """
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Skapa en HTML-tabell med alla växter och deras fuktgivare")
+    add_profile_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
 
@@ -0,0 +1,323 @@
+"""
+plant_alerts.py
+
+Local alerting for plants, evaluated on the live Home Assistant state stream.
+
+The script fetches all states once, and then subscribes to state_changed and state_reported events.
+Each event is only matched against the plants depending on the changed entity, so the work per event does not
+grow with the number of plants. Alerts are raised for:
+
+- moisture_status or conductivity_status of the plant not being ok
+- the battery of the plant's MiFlora sensor dropping below a threshold
+- the soil moisture meter of the plant not reporting for longer than a maximum age
+
+Only transitions are notified, after the condition has been stable for the debounce time,
+and notifications are batched into a single call to the notify action.
+"""
+import argparse
+import asyncio
+import heapq
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import my_secrets
+from home_assistant_websocket_client import HomeAssistantWebSocketClient
+
+# Condition names, and the notification text when raised and cleared
+CONDITIONS = {
+    "watering": ("needs watering", "has been watered"),
+    "conductivity": ("needs fertilizer", "conductivity is ok"),
+    "battery": ("sensor battery is low", "sensor battery is ok"),
+    "stale": ("has not been updated", "is updated again"),
+}
+
+
+def battery_entity(entity_id: str, states: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """
+    Resolves the MiFlora battery sensor of a plant, through the external sensor of its conductivity sensor.
+
+    Args:
+        entity_id (str): The plant entity id.
+        states (Dict[str, Dict[str, Any]]): All entity states, keyed on entity id.
+
+    Returns:
+        Optional[str]: The battery sensor entity id, None if the plant has no MiFlora sensor.
+    """
+    sensor_name: str = entity_id.split('.')[1]
+    conductivity_state = states.get('sensor.' + sensor_name + '_conductivity', {})
+    external_sensor = conductivity_state.get('attributes', {}).get('external_sensor')
+    if not external_sensor:
+        return None
+    battery_sensor_name = external_sensor.replace('conductivity', 'battery')
+    return battery_sensor_name if battery_sensor_name in states else None
+
+
+def meter_entity(entity_id: str, states: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Resolves the soil moisture meter of a plant, the external sensor of its soil moisture sensor.
+    The plant's own sensor only updates when the value changes, the meter on every report.
+
+    Args:
+        entity_id (str): The plant entity id.
+        states (Dict[str, Dict[str, Any]]): All entity states, keyed on entity id.
+
+    Returns:
+        str: The meter entity id, the plant's soil moisture sensor if it has no external sensor.
+    """
+    moisture_sensor = 'sensor.' + entity_id.split('.')[1] + '_soil_moisture'
+    external_sensor = states.get(moisture_sensor, {}).get('attributes', {}).get('external_sensor')
+    return external_sensor or moisture_sensor
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """
+    Converts a Home Assistant ISO time stamp to a POSIX time stamp.
+
+    Args:
+        value (Optional[str]): The ISO time stamp, e.g. a state's last_updated.
+
+    Returns:
+        Optional[float]: The POSIX time stamp, None if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class PlantAlertEngine:
+    def __init__(self, battery_threshold: float = 15, max_age: float = 6 * 3600, debounce: float = 60):
+        """
+        Initialize the alert engine.
+        :param battery_threshold: Battery percentage below which the battery alert is raised
+        :param max_age: Seconds since the plant's meter last reported before the stale alert is raised
+        :param debounce: Seconds a condition must be stable before its transition is notified
+        """
+        self.battery_threshold = battery_threshold
+        self.max_age = max_age
+        self.debounce = debounce
+
+        self._names: Dict[str, str] = {}
+        # Entity id to the plants depending on it
+        self._dependents: Dict[str, List[str]] = defaultdict(list)
+        self._battery: Dict[str, str] = {}
+        self._meter: Dict[str, str] = {}
+        # Last notified and currently evaluated value of each condition, per plant
+        self._notified: Dict[str, Dict[str, bool]] = {}
+        self._current: Dict[str, Dict[str, bool]] = {}
+        # Condition changes waiting for the debounce time, (plant, condition) to time of change
+        self._pending: Dict[Tuple[str, str], float] = {}
+        # Heap of (stale deadline, plant, last_reported), invalidated lazily when the meter reports
+        self._stale_deadlines: List[Tuple[float, str, float]] = []
+        self._last_reported: Dict[str, float] = {}
+        self._moisture_ok: Dict[str, bool] = {}
+        self._conductivity_ok: Dict[str, bool] = {}
+        self._battery_low: Dict[str, bool] = {}
+
+    def load(self, plants: List[Dict[str, Any]], states: Dict[str, Dict[str, Any]], now: float) -> None:
+        """
+        Set up the plants and their current conditions. Conditions found here are the baseline
+        and are not notified.
+        :param plants: Plant entities, as returned by get_plant_entities
+        :param states: All entity states, keyed on entity id
+        :param now: The current POSIX time
+        """
+        for plant in plants:
+            entity_id = plant["entity_id"]
+            self._names[entity_id] = plant["name"] or entity_id
+            self._dependents[entity_id].append(entity_id)
+            battery = battery_entity(entity_id, states)
+            if battery:
+                self._battery[entity_id] = battery
+                self._dependents[battery].append(entity_id)
+                self._update_battery(entity_id, states[battery])
+            meter = meter_entity(entity_id, states)
+            self._meter[entity_id] = meter
+            self._dependents[meter].append(entity_id)
+            if meter in states:
+                self._update_meter(entity_id, states[meter])
+            if entity_id in states:
+                self._update_plant(entity_id, states[entity_id])
+
+            conditions = self._evaluate(entity_id, now)
+            self._current[entity_id] = conditions
+            self._notified[entity_id] = dict(conditions)
+
+    def handle_state_changed(self, event: Dict[str, Any], now: float) -> None:
+        """
+        Re-evaluate the plants depending on the entity of a state_changed or state_reported event.
+        :param event: The event data, with entity_id and new_state
+        :param now: The current POSIX time
+        """
+        entity_id = event.get("entity_id")
+        new_state = event.get("new_state")
+        if entity_id not in self._dependents or new_state is None:
+            return
+
+        for plant_id in self._dependents[entity_id]:
+            if entity_id == plant_id:
+                self._update_plant(plant_id, new_state)
+            elif entity_id == self._meter[plant_id]:
+                self._update_meter(plant_id, new_state)
+            else:
+                self._update_battery(plant_id, new_state)
+            self._set_conditions(plant_id, self._evaluate(plant_id, now), now)
+
+    def check_stale(self, now: float) -> None:
+        """
+        Re-evaluate the plants whose stale deadline has passed.
+        :param now: The current POSIX time
+        """
+        while self._stale_deadlines and self._stale_deadlines[0][0] <= now:
+            _, plant_id, last_reported = heapq.heappop(self._stale_deadlines)
+            if self._last_reported.get(plant_id) == last_reported:
+                self._set_conditions(plant_id, self._evaluate(plant_id, now), now)
+
+    def pop_notifications(self, now: float) -> List[str]:
+        """
+        Collect the condition transitions that have been stable for the debounce time.
+        :param now: The current POSIX time
+        :return: Notification lines, one per transition
+        """
+        lines = []
+        for key, changed in list(self._pending.items()):
+            if now - changed < self.debounce:
+                continue
+            del self._pending[key]
+            plant_id, condition = key
+            active = self._current[plant_id][condition]
+            if self._notified[plant_id][condition] == active:
+                continue
+            self._notified[plant_id][condition] = active
+            raised, cleared = CONDITIONS[condition]
+            lines.append(f"{self._names[plant_id]} {raised if active else cleared}")
+        return lines
+
+    def _update_plant(self, plant_id: str, state: Dict[str, Any]) -> None:
+        attributes = state.get("attributes", {})
+        self._moisture_ok[plant_id] = attributes.get("moisture_status") in (None, "ok")
+        self._conductivity_ok[plant_id] = attributes.get("conductivity_status") in (None, "ok")
+
+    def _update_meter(self, plant_id: str, state: Dict[str, Any]) -> None:
+        last_reported = parse_time(state.get("last_reported") or state.get("last_updated"))
+        if last_reported is not None:
+            self._last_reported[plant_id] = last_reported
+            heapq.heappush(self._stale_deadlines, (last_reported + self.max_age, plant_id, last_reported))
+
+    def _update_battery(self, plant_id: str, state: Dict[str, Any]) -> None:
+        try:
+            self._battery_low[plant_id] = float(state.get("state")) < self.battery_threshold
+        except (TypeError, ValueError):
+            # Unknown or unavailable, keep the last known value
+            pass
+
+    def _evaluate(self, plant_id: str, now: float) -> Dict[str, bool]:
+        last_reported = self._last_reported.get(plant_id)
+        return {
+            "watering": not self._moisture_ok.get(plant_id, True),
+            "conductivity": not self._conductivity_ok.get(plant_id, True),
+            "battery": self._battery_low.get(plant_id, False),
+            "stale": last_reported is not None and now - last_reported > self.max_age,
+        }
+
+    def _set_conditions(self, plant_id: str, conditions: Dict[str, bool], now: float) -> None:
+        current = self._current[plant_id]
+        for condition, active in conditions.items():
+            if current[condition] != active:
+                current[condition] = active
+                self._pending[(plant_id, condition)] = now
+
+
+async def subscribe_state_reported(client: HomeAssistantWebSocketClient) -> None:
+    """
+    Subscribes to state_reported events, fired when a sensor reports the same value again.
+    Without them, a meter reporting a steady value only updates on state_changed events.
+
+    Args:
+        client (HomeAssistantWebSocketClient): A connected client.
+
+    Returns:
+        None
+    """
+    try:
+        await client.subscribe_events("state_reported")
+    except Exception as e:
+        print(f"Could not subscribe to state_reported events, meter reports of unchanged values are missed: {e}",
+              file=sys.stderr)
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Main function for the script.
+    Loads all plants, subscribes to state changes and sends batched notifications for alert transitions.
+
+    Workflow:
+        1. Connects to the Home Assistant WebSocket API using credentials from my_secrets.
+        2. Retrieves the plants and all states once, and sets the baseline conditions.
+        3. Subscribes to state_changed and state_reported events and re-evaluates the affected plants on each event.
+        4. Every batch interval, checks stale plants and sends the collected notifications.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+    notify_domain, notify_service = args.notify.split(".", 1)
+    engine = PlantAlertEngine(battery_threshold=args.battery_threshold,
+                              max_age=args.max_age * 3600,
+                              debounce=args.debounce)
+
+    client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
+    await client.connect()
+
+    plants = await client.get_plant_entities()
+    states = await client.get_states_dict()
+    engine.load(plants, states, time.time())
+    await client.subscribe_events("state_changed")
+    await subscribe_state_reported(client)
+    print(f"Watching {len(plants)} plants.")
+
+    next_flush = time.monotonic() + args.batch_interval
+    while True:
+        timeout = max(0.0, next_flush - time.monotonic())
+        try:
+            message = await asyncio.wait_for(client.receive_event(), timeout)
+            engine.handle_state_changed(message["event"].get("data", {}), time.time())
+        except asyncio.TimeoutError:
+            pass
+
+        if time.monotonic() < next_flush:
+            continue
+        next_flush = time.monotonic() + args.batch_interval
+
+        now = time.time()
+        engine.check_stale(now)
+        lines = engine.pop_notifications(now)
+        if lines:
+            print("\n".join(lines))
+            await client.call_service(notify_domain, notify_service, {
+                "title": "Plants",
+                "message": "\n".join(lines),
+            })
+
+
+if __name__ == "__main__":
+    """
+    Entry point for the script. Runs the main async logic.
+    """
+    parser = argparse.ArgumentParser(description="Send notifications when plants need attention")
+    parser.add_argument("--notify", default="notify.notify", help="Notify action to send notifications with")
+    parser.add_argument("--battery-threshold", type=float, default=15, help="Low battery threshold in percent")
+    parser.add_argument("--max-age", type=float, default=6, help="Hours without meter reports before a plant is stale")
+    parser.add_argument("--debounce", type=float, default=60, help="Seconds a condition must be stable before it is notified")
+    parser.add_argument("--batch-interval", type=float, default=30, help="Seconds between notification batches")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,234 @@
+"""
+plant_metrics_exporter.py
+
+Serves plant metrics in OpenMetrics text format, for scraping by Prometheus.
+
+All states are fetched once at start, after which an in-memory mirror is kept up to date from
+state_changed and state_reported events, so a scrape never makes a request to Home Assistant.
+Each sample line is rendered when its entity changes or reports, and the response body is cached
+until the next change.
+
+The sensor age is exported as plant_sensor_last_reported_timestamp_seconds, the time the soil
+moisture meter of the plant last reported a value. Use time() - metric in PromQL to get the age.
+Exporting the age itself would change the response on every scrape.
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import my_secrets
+from home_assistant_websocket_client import HomeAssistantWebSocketClient
+from plant_alerts import battery_entity, meter_entity, parse_time, subscribe_state_reported
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Metric family name to help text
+METRICS = {
+    "plant_moisture_percent": "Soil moisture of the plant",
+    "plant_conductivity_microsiemens": "Soil conductivity of the plant",
+    "plant_battery_percent": "Battery level of the plant's MiFlora sensor",
+    "plant_moisture_ok": "1 if the moisture status of the plant is ok",
+    "plant_conductivity_ok": "1 if the conductivity status of the plant is ok",
+    "plant_sensor_last_reported_timestamp_seconds": "Time the soil moisture meter of the plant last reported a value",
+}
+
+
+def escape_label(value: str) -> str:
+    """
+    Escapes a label value for the OpenMetrics text format.
+
+    Args:
+        value (str): The label value.
+
+    Returns:
+        str: The escaped label value.
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def as_float(value: Any) -> Optional[float]:
+    """
+    Converts a state value to float.
+
+    Args:
+        value (Any): The state value.
+
+    Returns:
+        Optional[float]: The value, None if it is unknown, unavailable or not a number.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PlantMetrics:
+    def __init__(self):
+        """
+        Initialize the metrics mirror.
+        """
+        self._labels: Dict[str, str] = {}
+        # Entity id to the (plant, metric) samples it feeds
+        self._dependents: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        # Rendered sample line, per metric and plant
+        self._lines: Dict[str, Dict[str, str]] = {name: {} for name in METRICS}
+        self._body: Optional[bytes] = None
+
+    def load(self, plants: List[Dict[str, Any]], states: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Set up the plants and render their samples from the current states.
+        :param plants: Plant entities, as returned by get_plant_entities
+        :param states: All entity states, keyed on entity id
+        """
+        for plant in plants:
+            entity_id = plant["entity_id"]
+            sensor_name = entity_id.split('.')[1]
+            area = plant["area_name"] or ""
+            name = plant["name"] or entity_id
+            # The entity id keeps the series of plants with the same name in an area apart
+            self._labels[entity_id] = (f'area="{escape_label(area)}",plant="{escape_label(name)}",'
+                                       f'entity_id="{escape_label(entity_id)}"')
+
+            sources = [
+                (entity_id, "plant_moisture_ok"),
+                (entity_id, "plant_conductivity_ok"),
+                (meter_entity(entity_id, states), "plant_sensor_last_reported_timestamp_seconds"),
+                ('sensor.' + sensor_name + '_soil_moisture', "plant_moisture_percent"),
+                ('sensor.' + sensor_name + '_conductivity', "plant_conductivity_microsiemens"),
+            ]
+            battery = battery_entity(entity_id, states)
+            if battery:
+                sources.append((battery, "plant_battery_percent"))
+
+            for source, metric in sources:
+                self._dependents[source].append((entity_id, metric))
+                if source in states:
+                    self._render(entity_id, metric, states[source])
+        self._body = None
+
+    def handle_state_changed(self, event: Dict[str, Any]) -> None:
+        """
+        Update the samples fed by the entity of a state_changed or state_reported event.
+        :param event: The event data, with entity_id and new_state
+        """
+        entity_id = event.get("entity_id")
+        if entity_id not in self._dependents:
+            return
+
+        new_state = event.get("new_state") or {}
+        for plant_id, metric in self._dependents[entity_id]:
+            self._render(plant_id, metric, new_state)
+        self._body = None
+
+    def body(self) -> bytes:
+        """
+        Return the OpenMetrics response body, rendering it only if a sample has changed.
+        :return: The response body
+        """
+        if self._body is None:
+            parts = []
+            for name, help_text in METRICS.items():
+                parts.append(f"# TYPE {name} gauge\n# HELP {name} {help_text}\n")
+                parts.extend(self._lines[name].values())
+            parts.append("# EOF\n")
+            self._body = "".join(parts).encode("utf-8")
+        return self._body
+
+    def _render(self, plant_id: str, metric: str, state: Dict[str, Any]) -> None:
+        attributes = state.get("attributes", {})
+        if metric == "plant_moisture_ok":
+            status = attributes.get("moisture_status")
+            value = None if status is None else float(status == "ok")
+        elif metric == "plant_conductivity_ok":
+            status = attributes.get("conductivity_status")
+            value = None if status is None else float(status == "ok")
+        elif metric == "plant_sensor_last_reported_timestamp_seconds":
+            value = parse_time(state.get("last_reported") or state.get("last_updated"))
+        else:
+            value = as_float(state.get("state"))
+
+        if value is None:
+            self._lines[metric].pop(plant_id, None)
+        else:
+            self._lines[metric][plant_id] = f"{metric}{{{self._labels[plant_id]}}} {value}\n"
+
+
+async def serve_metrics(metrics: PlantMetrics, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Handle a single HTTP request, serving the metrics on GET /metrics.
+
+    Args:
+        metrics (PlantMetrics): The metrics mirror.
+        reader (asyncio.StreamReader): The request stream.
+        writer (asyncio.StreamWriter): The response stream.
+
+    Returns:
+        None
+    """
+    try:
+        request_line = await reader.readline()
+        # Skip the request headers
+        while (await reader.readline()).strip():
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", CONTENT_TYPE, metrics.body()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        writer.write(body)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Main function for the script.
+    Loads all plants into the metrics mirror, serves the metrics and keeps the mirror up to date.
+
+    Workflow:
+        1. Connects to the Home Assistant WebSocket API using credentials from my_secrets.
+        2. Retrieves the plants and all states once, and renders all samples.
+        3. Starts the HTTP server.
+        4. Subscribes to state_changed and state_reported events and updates the affected samples on each event.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+    metrics = PlantMetrics()
+
+    client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
+    await client.connect()
+
+    plants = await client.get_plant_entities()
+    states = await client.get_states_dict()
+    metrics.load(plants, states)
+    await client.subscribe_events("state_changed")
+    await subscribe_state_reported(client)
+
+    server = await asyncio.start_server(lambda reader, writer: serve_metrics(metrics, reader, writer),
+                                        args.host, args.port)
+    print(f"Serving metrics for {len(plants)} plants on http://{args.host}:{args.port}/metrics")
+
+    async with server:
+        while True:
+            message = await client.receive_event()
+            metrics.handle_state_changed(message["event"].get("data", {}))
+
+
+if __name__ == "__main__":
+    """
+    Entry point for the script. Runs the main async logic.
+    """
+    parser = argparse.ArgumentParser(description="Serve plant metrics in OpenMetrics format")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=9717, help="Port to listen on")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""
+plant_thumbnails.py
+
+Thumbnail cache for plant pictures, used by build_mushroom_templates.py --thumbnails.
+
+The entity_picture of each plant is downloaded from Home Assistant, resized and stored as WebP,
+named by a hash of the downloaded image. The directory needs to be served by Home Assistant,
+e.g. a mounted config/www/plant_thumbnails folder, so the dashboard can use static /local URLs.
+
+An index file in the directory maps each picture URL and thumbnail size to its thumbnail, along
+with the ETag and Last-Modified headers of the picture. Pictures in the cache are requested
+conditionally, so they are neither downloaded nor resized again unless they have changed, or
+refresh is requested. The access token is only sent to Home Assistant itself.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+INDEX_FILE = "index.json"
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_home_assistant_url(url: str, base_url: str) -> bool:
+    """
+    Checks whether a picture URL is served by Home Assistant itself, on the same scheme, host and port as base_url.
+
+    Args:
+        url (str): The absolute picture URL.
+        base_url (str): Home Assistant URL, e.g. http://homeassistant.local:8123.
+
+    Returns:
+        bool: True if the access token may be sent with the request.
+    """
+    def origin(value: str) -> Tuple[str, Optional[str], Optional[int]]:
+        parts = urllib.parse.urlsplit(value)
+        return parts.scheme, parts.hostname, parts.port or DEFAULT_PORTS.get(parts.scheme)
+
+    try:
+        return origin(url) == origin(base_url)
+    except ValueError:
+        return False
+
+
+def download(url: str, token: Optional[str], etag: Optional[str] = None,
+             last_modified: Optional[str] = None) -> Optional[Tuple[bytes, Dict[str, Optional[str]]]]:
+    """
+    Downloads a picture, unless it has not changed since it was last downloaded.
+
+    Args:
+        url (str): The absolute picture URL.
+        token (Optional[str]): Long-lived access token, for pictures served by Home Assistant.
+            None for pictures on other hosts, which must not receive it.
+        etag (Optional[str]): ETag of the last download, sent as If-None-Match.
+        last_modified (Optional[str]): Last-Modified of the last download, sent as If-Modified-Since.
+
+    Returns:
+        Optional[Tuple[bytes, Dict[str, Optional[str]]]]: The picture, with its ETag and Last-Modified
+            headers, or None if it has not changed.
+    """
+    headers = {}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read(), {"etag": response.headers.get("ETag"),
+                                     "last_modified": response.headers.get("Last-Modified")}
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def make_thumbnail(data: bytes, path: str, size: int) -> None:
+    """
+    Resizes a picture to fit within size x size pixels and saves it as WebP.
+
+    Args:
+        data (bytes): The picture.
+        path (str): File name of the thumbnail.
+        size (int): Maximum width and height of the thumbnail.
+
+    Returns:
+        None
+    """
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((size, size))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    image.save(path, "WEBP", quality=80)
+
+
+async def build_thumbnails(pictures: Dict[str, Optional[str]], base_url: str, token: str, directory: str,
+                           url_prefix: str, size: int = 128, concurrency: int = 8,
+                           refresh: bool = False) -> Dict[str, str]:
+    """
+    Creates thumbnails for the given plant pictures, downloading them concurrently.
+
+    Args:
+        pictures (Dict[str, Optional[str]]): entity_picture of each plant, keyed on entity id.
+        base_url (str): Home Assistant URL, e.g. http://homeassistant.local:8123, for relative pictures.
+        token (str): Long-lived access token.
+        directory (str): Thumbnail cache directory.
+        url_prefix (str): URL the directory is served from, e.g. /local/plant_thumbnails.
+        size (int): Maximum width and height of the thumbnails.
+        concurrency (int): Maximum number of concurrent downloads.
+        refresh (bool): Download all pictures again, even if they have not changed.
+
+    Returns:
+        Dict[str, str]: The thumbnail URL of each plant, keyed on entity id. Plants without
+            a picture, or whose picture could not be downloaded, are left out.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, INDEX_FILE)
+    # Picture URL to the thumbnail file, ETag and Last-Modified, per thumbnail size
+    index: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def thumbnail(picture: str) -> Optional[str]:
+        entries = index.get(picture)
+        if not isinstance(entries, dict):
+            entries = index[picture] = {}
+        entry = entries.get(str(size))
+        if entry and (refresh or not os.path.exists(os.path.join(directory, entry["file"]))):
+            entry = None
+
+        url = picture if "://" in picture else base_url.rstrip("/") + picture
+        async with semaphore:
+            try:
+                downloaded = await asyncio.to_thread(
+                    download, url, token if is_home_assistant_url(url, base_url) else None,
+                    entry and entry.get("etag"), entry and entry.get("last_modified"))
+                if downloaded is None:
+                    return entry["file"]
+                data, headers = downloaded
+                file_name = f"{hashlib.sha256(data).hexdigest()[:16]}_{size}.webp"
+                path = os.path.join(directory, file_name)
+                if not os.path.exists(path):
+                    await asyncio.to_thread(make_thumbnail, data, path, size)
+            except OSError as e:
+                print(f"Failed to create thumbnail for {url}: {e}", file=sys.stderr)
+                return entry["file"] if entry else None
+
+        entries[str(size)] = {"file": file_name, **headers}
+        return file_name
+
+    unique_pictures = sorted({picture for picture in pictures.values() if picture})
+    file_names = dict(zip(unique_pictures, await asyncio.gather(*(thumbnail(picture) for picture in unique_pictures))))
+
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+
+    prefix = url_prefix.rstrip("/")
+    return {entity_id: f"{prefix}/{file_names[picture]}"
+            for entity_id, picture in pictures.items() if picture and file_names.get(picture)}
@@ -0,0 +1,201 @@
+"""
+profile_templates.py
+
+Measures the cost of the templates in the output of the builder scripts, e.g.
+build_mushroom_templates.py, build_markdown_template.py and the OpenEPaperLink builders.
+
+Each template is rendered on Home Assistant using render_template, several at a time, and for
+each card the render time, the number of entities the templates depend on and the output size
+is reported, most expensive cards first. The render time runs from sending a template to receiving
+its result, and leaves out unsubscribing and waiting for other renders.
+
+Save the output of a builder to a file, and pass it to the script:
+
+    python3 build_mushroom_templates.py > mushroom.yaml
+    python3 profile_templates.py mushroom.yaml build_markdown_template.yaml
+"""
+import argparse
+import asyncio
+import json
+import re
+from typing import Any, Dict, List
+
+import my_secrets
+from home_assistant_websocket_client import HomeAssistantWebSocketClient
+
+# A key followed by a block scalar indicator, e.g. "secondary: >" or "- value: >-"
+BLOCK_KEY = re.compile(r"^(\s*)(?:- )?([\w' ]+):\s*[>|][-+]?\s*$")
+# A key with an inline value
+INLINE_KEY = re.compile(r"^\s*(?:- )?([\w' ]+):\s*(.+?)\s*$")
+# Start of a card, or of an OpenEPaperLink action
+CARD_START = re.compile(r"^\s*(?:- )?(?:type|action):\s*(\S+)")
+# OpenEPaperLink drawcustom payload element types, which are part of the action rather than cards
+PAYLOAD_TYPES = {"text", "multiline", "icon", "line", "rectangle", "circle", "ellipse", "polygon", "arc",
+                 "qrcode", "plot", "progress_bar", "diagram", "dlimg", "debug_grid"}
+
+
+def extract_templates(lines: List[str], source: str) -> List[Dict[str, Any]]:
+    """
+    Extracts the templates from builder output, grouped on the card or action they belong to.
+    Only values containing template markup are extracted.
+
+    Args:
+        lines (List[str]): The lines of the builder output.
+        source (str): Name of the output file, used in the card labels.
+
+    Returns:
+        List[Dict[str, Any]]: One dictionary per card, with a label, the card entity if any,
+            and a list of (key, template) pairs.
+    """
+    cards: List[Dict[str, Any]] = []
+    card: Dict[str, Any] = {"label": f"{source}:1", "entity": None, "templates": []}
+    cards.append(card)
+    index = 0
+    while index < len(lines):
+        line = lines[index].rstrip("\n")
+        index += 1
+
+        card_start = CARD_START.match(line)
+        if card_start and card_start.group(1) not in PAYLOAD_TYPES:
+            card = {"label": f"{source}:{index}", "entity": None, "templates": []}
+            cards.append(card)
+
+        block = BLOCK_KEY.match(line)
+        if block:
+            key_indent = len(block.group(1))
+            block_lines = []
+            while index < len(lines):
+                next_line = lines[index].rstrip("\n")
+                if next_line.strip() and len(next_line) - len(next_line.lstrip()) <= key_indent:
+                    break
+                block_lines.append(next_line.strip())
+                index += 1
+            value = "\n".join(block_lines).strip()
+            if "{{" in value or "{%" in value:
+                card["templates"].append((block.group(2).strip(), value))
+            continue
+
+        inline = INLINE_KEY.match(line)
+        if inline:
+            key, value = inline.group(1).strip(), inline.group(2)
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]
+            if key == "entity" and card["entity"] is None:
+                card["entity"] = value
+            if key in ("entity", "primary", "title") and " " not in card["label"]:
+                card["label"] += f" {value}"
+            if "{{" in value or "{%" in value:
+                card["templates"].append((key, value))
+
+    return [card for card in cards if card["templates"]]
+
+
+async def profile_card(client: HomeAssistantWebSocketClient, card: Dict[str, Any],
+                       semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """
+    Renders all templates of a card and collects their cost.
+
+    Args:
+        client (HomeAssistantWebSocketClient): A connected client.
+        card (Dict[str, Any]): A card, as returned by `extract_templates`.
+        semaphore (asyncio.Semaphore): Limits the number of concurrent renders.
+
+    Returns:
+        Dict[str, Any]: Label, render time in seconds, entities the templates depend on,
+            whether any template depends on all entities or on time, output size and errors.
+    """
+    variables = {"entity": card["entity"]} if card["entity"] else None
+    entities = set()
+    seconds = 0.0
+    output_size = 0
+    all_entities = False
+    time_based = False
+    errors = []
+    for key, template in card["templates"]:
+        async with semaphore:
+            event = await client.render_template(template, variables)
+        seconds += event.get("seconds", 0.0)
+        if "error" in event:
+            errors.append(f"{key}: {event['error']}")
+            continue
+        listeners = event.get("listeners", {})
+        entities.update(listeners.get("entities", []))
+        all_entities = all_entities or listeners.get("all", False)
+        time_based = time_based or listeners.get("time", False)
+        output_size += len(str(event.get("result", "")))
+
+    return {
+        "card": card["label"],
+        "templates": len(card["templates"]),
+        "seconds": round(seconds, 6),
+        "entities": len(entities),
+        "all_entities": all_entities,
+        "time": time_based,
+        "output_size": output_size,
+        "errors": errors,
+    }
+
+
+async def profile_templates(client: HomeAssistantWebSocketClient, cards: List[Dict[str, Any]],
+                            concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Profiles all cards concurrently, and ranks them by cost.
+
+    Args:
+        client (HomeAssistantWebSocketClient): A connected client.
+        cards (List[Dict[str, Any]]): The cards, as returned by `extract_templates`.
+        concurrency (int): Maximum number of templates rendered at the same time.
+
+    Returns:
+        List[Dict[str, Any]]: The result of `profile_card` for each card, most expensive first.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(profile_card(client, card, semaphore) for card in cards))
+    return sorted(results, key=lambda result: (result["all_entities"], result["entities"], result["seconds"]),
+                  reverse=True)
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Main function for the script.
+    Extracts the templates from the given builder output files, renders them and prints the ranking.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+    cards = []
+    for file_name in args.files:
+        with open(file_name, encoding="utf-8") as f:
+            cards.extend(extract_templates(f.readlines(), file_name))
+
+    client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
+    await client.connect()
+    results = await profile_templates(client, cards, args.concurrency)
+    await client.close()
+
+    print(f"{'Time (ms)':>10} {'Entities':>9} {'Output':>8}  Card")
+    for result in results[:args.top]:
+        entities = "all" if result["all_entities"] else str(result["entities"])
+        flags = " (time)" if result["time"] else ""
+        print(f"{result['seconds'] * 1000:>10.1f} {entities:>9} {result['output_size']:>8}  {result['card']}{flags}")
+        for error in result["errors"]:
+            print(f"{'':>31}error: {error}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    """
+    Entry point for the script. Runs the main async logic.
+    """
+    parser = argparse.ArgumentParser(description="Measure the cost of the templates in builder output")
+    parser.add_argument("files", nargs="+", help="Builder output files")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of templates rendered at the same time")
+    parser.add_argument("--top", type=int, default=20, help="Number of cards to show")
+    parser.add_argument("--report", help="Write all results as JSON to this file")
+    asyncio.run(main(parser.parse_args()))
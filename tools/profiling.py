@@ -0,0 +1,174 @@
+"""
+profiling.py
+
+Phase level profiling for the builder scripts. A Profiler records wall time, call count and,
+optionally, allocated memory for named phases such as "connect/auth", "registry fetch",
+"state fetch", "decode", "plant resolution", "render" and "write". Phases may be nested,
+e.g. "state fetch" within "attribute lookup", so the report holds both the inclusive and the
+exclusive time of each phase, and the phases it was nested in. The whole run can additionally be
+wrapped in cProfile. The result is written as a JSON report.
+"""
+import argparse
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, trace_allocations: bool = False, use_cprofile: bool = False):
+        """
+        Initialize the profiler.
+        :param enabled: Record phase timings. When False, phase() is a no-op
+        :param trace_allocations: Record allocated bytes per phase using tracemalloc
+        :param use_cprofile: Wrap the run in cProfile and include the top functions in the report
+        """
+        self.enabled = enabled
+        self.trace_allocations = enabled and trace_allocations
+        self.use_cprofile = enabled and use_cprofile
+
+        self._phases: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"calls": 0, "seconds": 0.0, "exclusive_seconds": 0.0, "allocated_bytes": 0, "nested_in": set()})
+        # Currently open phases, innermost last, as [name, seconds in child phases, bytes in child phases]
+        self._stack: List[List[Any]] = []
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._started: Optional[float] = None
+        self._total: float = 0.0
+        self._peak_bytes: int = 0
+
+    def start(self) -> None:
+        """
+        Start the profiled run.
+        """
+        if not self.enabled:
+            return
+        if self.trace_allocations:
+            tracemalloc.start()
+        if self.use_cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._started = time.perf_counter()
+
+    def stop(self) -> None:
+        """
+        Stop the profiled run.
+        """
+        if not self.enabled or self._started is None:
+            return
+        self._total = time.perf_counter() - self._started
+        self._started = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.trace_allocations:
+            self._peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Context manager recording time and allocations for a named phase.
+        Repeated phases accumulate. Time spent in phases nested within this one is included in its
+        inclusive time, but not in its exclusive time or allocations. Phases are expected to be entered
+        from one task at a time, as in the builder scripts.
+        :param name: Name of the phase
+        """
+        if not self.enabled:
+            yield
+            return
+
+        entry = self._phases[name]
+        if self._stack:
+            entry["nested_in"].add(self._stack[-1][0])
+        frame = [name, 0.0, 0]
+        self._stack.append(frame)
+
+        tracing = self.trace_allocations and tracemalloc.is_tracing()
+        allocated_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            allocated = tracemalloc.get_traced_memory()[0] - allocated_before if tracing else 0
+            self._stack.pop()
+            entry["calls"] += 1
+            entry["seconds"] += elapsed
+            entry["exclusive_seconds"] += elapsed - frame[1]
+            entry["allocated_bytes"] += allocated - frame[2]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+                self._stack[-1][2] += allocated
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build the profiling report.
+        :return: Dictionary with total time, per phase figures and optional cProfile statistics.
+                 Exclusive times add up to at most the total time, inclusive times do not
+        """
+        report: Dict[str, Any] = {
+            "total_seconds": round(self._total, 6),
+            "phases": {
+                name: {
+                    "calls": entry["calls"],
+                    "seconds": round(entry["seconds"], 6),
+                    "exclusive_seconds": round(entry["exclusive_seconds"], 6),
+                    "allocated_bytes": entry["allocated_bytes"] if self.trace_allocations else None,
+                    "nested_in": sorted(entry["nested_in"]),
+                }
+                for name, entry in sorted(self._phases.items(), key=lambda item: -item[1]["exclusive_seconds"])
+            },
+        }
+        if self.trace_allocations:
+            report["peak_traced_bytes"] = self._peak_bytes
+        if self._cprofile is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(30)
+            report["cprofile"] = stream.getvalue().splitlines()
+        return report
+
+    def write_report(self, path: str) -> None:
+        """
+        Write the profiling report as JSON, and print a short summary to stderr.
+        :param path: File name of the JSON report
+        """
+        if not self.enabled:
+            return
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(path + ".prof")
+
+        print(f"Profile written to {path} (total {report['total_seconds']:.3f} s)", file=sys.stderr)
+        for name, entry in report["phases"].items():
+            nested = f" (in {', '.join(entry['nested_in'])})" if entry["nested_in"] else ""
+            print(f"  {name:<20} {entry['calls']:>6} calls {entry['exclusive_seconds']:>10.3f} s exclusive"
+                  f" {entry['seconds']:>10.3f} s inclusive{nested}", file=sys.stderr)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the profiling command line options to a builder's argument parser.
+    :param parser: The argument parser to extend
+    """
+    parser.add_argument("--profile", metavar="REPORT", help="Record time per phase and write a JSON report to REPORT")
+    parser.add_argument("--profile-allocations", action="store_true", help="Also record allocations per phase using tracemalloc")
+    parser.add_argument("--profile-cprofile", action="store_true", help="Also wrap the run in cProfile")
+
+
+def create_profiler(args: argparse.Namespace) -> Profiler:
+    """
+    Create a profiler from parsed command line options.
+    :param args: Parsed arguments, see add_profile_arguments
+    :return: A Profiler, disabled unless --profile was given
+    """
+    return Profiler(enabled=args.profile is not None,
+                    trace_allocations=args.profile_allocations,
+                    use_cprofile=args.profile_cprofile)
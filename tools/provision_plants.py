@@ -0,0 +1,206 @@
+"""
+provision_plants.py
+
+Applies a desired state for plants: area, thresholds and external sensors.
+
+The desired state is a JSON file, keyed on plant entity id:
+
+    {
+        "plant.gastrum_aloe_vera": {
+            "area": "Gästrum",
+            "thresholds": {"min_soil_moisture": 20, "max_soil_moisture": 60},
+            "external_sensors": {"soil_moisture": "sensor.miflora_1_moisture"}
+        }
+    }
+
+Thresholds are the plant's number entities, e.g. number.gastrum_aloe_vera_min_soil_moisture, and
+external sensors are keyed on the plant's meter sensor, e.g. sensor.gastrum_aloe_vera_soil_moisture.
+
+The current state is read with one bulk fetch of the registries and states, and only the
+differences are applied, so a run where nothing has changed makes no further requests.
+Changes are applied concurrently, limited by --concurrency, and a result is reported for each.
+"""
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import my_secrets
+from home_assistant_websocket_client import HomeAssistantWebSocketClient
+
+
+def compute_changes(desired: Dict[str, Dict[str, Any]], plants: List[Dict[str, Any]],
+                    states: Dict[str, Dict[str, Any]], area_ids: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Compares the desired state with the current state and returns the changes needed.
+
+    Args:
+        desired (Dict[str, Dict[str, Any]]): The desired state, keyed on plant entity id.
+        plants (List[Dict[str, Any]]): Plant entities, as returned by `get_plant_entities`.
+        states (Dict[str, Dict[str, Any]]): All entity states, keyed on entity id.
+        area_ids (Dict[str, str]): Area ids keyed on area name.
+
+    Returns:
+        List[Dict[str, Any]]: One dictionary per change, with plant, kind, target, current and desired value.
+            Unknown plants, areas and entities, and thresholds that are not numbers, are returned with kind "error".
+    """
+    plants_by_id = {plant["entity_id"]: plant for plant in plants}
+    changes = []
+    for entity_id, plant_config in desired.items():
+        plant = plants_by_id.get(entity_id)
+        if plant is None:
+            changes.append({"plant": entity_id, "kind": "error", "target": entity_id,
+                            "current": None, "desired": "unknown plant"})
+            continue
+        sensor_name = entity_id.split('.')[1]
+
+        area = plant_config.get("area")
+        if area is not None and area != plant["area_name"]:
+            if area in area_ids:
+                changes.append({"plant": entity_id, "kind": "area", "target": plant["device_id"],
+                                "current": plant["area_name"], "desired": area, "area_id": area_ids[area]})
+            else:
+                changes.append({"plant": entity_id, "kind": "error", "target": plant["device_id"],
+                                "current": plant["area_name"], "desired": f"unknown area {area}"})
+
+        for key, value in plant_config.get("thresholds", {}).items():
+            number_entity = f"number.{sensor_name}_{key}"
+            state = states.get(number_entity)
+            if state is None:
+                changes.append({"plant": entity_id, "kind": "error", "target": number_entity,
+                                "current": None, "desired": "unknown threshold"})
+                continue
+            try:
+                desired_value = float(value)
+            except (TypeError, ValueError):
+                changes.append({"plant": entity_id, "kind": "error", "target": number_entity,
+                                "current": state.get("state"), "desired": f"invalid threshold {value}"})
+                continue
+            try:
+                current = float(state.get("state"))
+            except (TypeError, ValueError):
+                current = None
+            if current != desired_value:
+                changes.append({"plant": entity_id, "kind": "threshold", "target": number_entity,
+                                "current": state.get("state"), "desired": value})
+
+        for key, sensor in plant_config.get("external_sensors", {}).items():
+            meter_entity = f"sensor.{sensor_name}_{key}"
+            state = states.get(meter_entity)
+            if state is None:
+                changes.append({"plant": entity_id, "kind": "error", "target": meter_entity,
+                                "current": None, "desired": "unknown meter sensor"})
+                continue
+            current = state.get("attributes", {}).get("external_sensor")
+            if current != sensor:
+                changes.append({"plant": entity_id, "kind": "external_sensor", "target": meter_entity,
+                                "current": current, "desired": sensor})
+    return changes
+
+
+async def apply_change(client: HomeAssistantWebSocketClient, change: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies a single change.
+
+    Args:
+        client (HomeAssistantWebSocketClient): A connected client.
+        change (Dict[str, Any]): The change, as returned by `compute_changes`.
+
+    Returns:
+        Dict[str, Any]: The API response.
+    """
+    if change["kind"] == "area":
+        return await client.update_device(change["target"], area_id=change["area_id"])
+    if change["kind"] == "threshold":
+        return await client.call_service("number", "set_value",
+                                         {"entity_id": change["target"], "value": change["desired"]})
+    if change["kind"] == "external_sensor":
+        return await client.call_service("plant", "replace_sensor",
+                                         {"meter_entity": change["target"], "new_sensor": change["desired"]})
+    return {"success": False, "error": change["desired"]}
+
+
+async def apply_changes(client: HomeAssistantWebSocketClient, changes: List[Dict[str, Any]],
+                        concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Applies changes concurrently, with at most `concurrency` requests in flight.
+
+    Args:
+        client (HomeAssistantWebSocketClient): A connected client.
+        changes (List[Dict[str, Any]]): The changes, as returned by `compute_changes`.
+        concurrency (int): Maximum number of concurrent requests.
+
+    Returns:
+        List[Dict[str, Any]]: The API response for each change, in the same order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(change: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await apply_change(client, change)
+
+    return await asyncio.gather(*(limited(change) for change in changes))
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Main function for the script.
+    Reads the desired state, computes the changes against Home Assistant and applies them.
+
+    Workflow:
+        1. Connects to the Home Assistant WebSocket API using credentials from my_secrets.
+        2. Retrieves the registries and all states once.
+        3. Computes the changes, and prints them.
+        4. Unless --dry-run is given, applies the changes and prints the result of each.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+    with open(args.desired_state, encoding="utf-8") as f:
+        desired = json.load(f)
+
+    client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
+    await client.connect()
+
+    plants = await client.get_plant_entities()
+    states = await client.get_states_dict()
+    area_ids = await client.get_area_ids()
+
+    changes = compute_changes(desired, plants, states, area_ids)
+    if not changes:
+        print("Nothing to change.")
+        await client.close()
+        return
+
+    for change in changes:
+        print(f"{change['plant']}: {change['kind']} {change['target']}: {change['current']} -> {change['desired']}")
+    if args.dry_run:
+        await client.close()
+        return
+
+    applicable = [change for change in changes if change["kind"] != "error"]
+    responses = await apply_changes(client, applicable, args.concurrency)
+    failed = 0
+    for change, response in zip(applicable, responses):
+        if response.get("success", False):
+            print(f"OK     {change['plant']}: {change['kind']} {change['target']}")
+        else:
+            failed += 1
+            print(f"FAILED {change['plant']}: {change['kind']} {change['target']}: {response.get('error')}")
+    print(f"{len(applicable) - failed} applied, {failed} failed, {len(changes) - len(applicable)} skipped.")
+
+    await client.close()
+
+
+if __name__ == "__main__":
+    """
+    Entry point for the script. Runs the main async logic.
+    """
+    parser = argparse.ArgumentParser(description="Apply a desired state to plants")
+    parser.add_argument("desired_state", help="JSON file with the desired state")
+    parser.add_argument("--dry-run", action="store_true", help="Only show the changes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of concurrent requests")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,268 @@
+"""
+render_openepaperlink_images.py
+
+Renders the OpenEPaperLink plant tag images locally, instead of having Home Assistant render
+a drawcustom payload on every update. The images use the same layouts as
+build_openepaperlink_296x128_actions.py and build_openepaperlink_actions.py, and are stored
+in a content addressed cache, named by a hash of the values shown on the tag. A tag is only
+sent a new image, using an open_epaper_link.drawcustom action with a single dlimg payload element,
+when that hash has changed.
+
+The cache directory needs to be served by Home Assistant, e.g. a mounted config/www/epaper
+folder, and --base-url is the URL the images are downloaded from, e.g.
+http://homeassistant.local:8123/local/epaper.
+
+The time stamp shown by the drawcustom actions is left out, as it would change every image.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+import my_secrets
+from home_assistant_websocket_client import HomeAssistantWebSocketClient
+from profiling import add_profile_arguments, create_profiler
+
+# Tag size, row height, icon x positions, icon size and text size for each layout, and the
+# centre x position and size of the thumbs up/down background icon, for layouts that have one
+LAYOUTS = {
+    "296x128": {"size": (296, 128), "row_height": 20, "icon_x": (2, 20), "icon_size": 20, "text_x": 46, "text_size": 14,
+                "background_icon_x": 148, "background_icon_size": 100},
+    "400x300": {"size": (400, 300), "row_height": 22, "icon_x": (2, 22), "icon_size": 20, "text_x": 46, "text_size": 18},
+}
+
+# Material Design Icons code points, see build_esphome_display_sensors.py
+MDI_ICONS = {
+    "water": "\U000F058C",
+    "water-off": "\U000F058D",
+    "leaf": "\U000F032A",
+    "leaf-off": "\U000F12D9",
+    "thumb-up-outline": "\U000F0514",
+    "thumb-down-outline": "\U000F0512",
+}
+
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+WHITE = (255, 255, 255)
+
+
+def as_int(value: Any) -> int:
+    """
+    Convert a state value to int, like the | int(0) template filter.
+
+    Args:
+        value (Any): The state value.
+
+    Returns:
+        int: The value as an integer, 0 if it can not be converted.
+    """
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_plant_values(plant_entities: List[Dict[str, Any]], states: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Collects the values shown on a tag for each plant.
+
+    Args:
+        plant_entities (List[Dict[str, Any]]): The plant entities shown on the tag.
+        states (Dict[str, Dict[str, Any]]): All entity states, keyed on entity id.
+
+    Returns:
+        List[Dict[str, Any]]: Name, status flags, moisture and conductivity for each plant.
+    """
+    values = []
+    for plant_entity in plant_entities:
+        entity_id: str = plant_entity['entity_id']
+        sensor_name: str = entity_id.split('.')[1]
+        attributes = states.get(entity_id, {}).get('attributes', {})
+        values.append({
+            "name": attributes.get('friendly_name', plant_entity['name']),
+            "moisture_ok": attributes.get('moisture_status') == 'ok',
+            "conductivity_ok": attributes.get('conductivity_status') == 'ok',
+            "moisture": as_int(states.get(f"sensor.{sensor_name}_soil_moisture", {}).get('state')),
+            "conductivity": as_int(states.get(f"sensor.{sensor_name}_conductivity", {}).get('state')),
+        })
+    return values
+
+
+def content_hash(layout: str, values: List[Dict[str, Any]]) -> str:
+    """
+    Calculates the cache key for a tag image.
+
+    Args:
+        layout (str): The tag layout name.
+        values (List[Dict[str, Any]]): The plant values shown on the tag.
+
+    Returns:
+        str: A hex digest of the layout and values.
+    """
+    data = json.dumps({"layout": layout, "values": values}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def render_image(layout: str, values: List[Dict[str, Any]], text_font_file: Optional[str],
+                 icon_font_file: Optional[str]) -> Image.Image:
+    """
+    Renders a tag image.
+
+    Args:
+        layout (str): The tag layout name, a key in LAYOUTS.
+        values (List[Dict[str, Any]]): The plant values, as returned by `get_plant_values`.
+        text_font_file (Optional[str]): TrueType font for the text, Pillow's default font if None.
+        icon_font_file (Optional[str]): Material Design Icons font. If None, plain shapes are drawn instead of icons.
+
+    Returns:
+        Image.Image: The rendered image.
+    """
+    spec = LAYOUTS[layout]
+    image = Image.new("RGB", spec["size"], WHITE)
+    draw = ImageDraw.Draw(image)
+    if text_font_file:
+        text_font = ImageFont.truetype(text_font_file, spec["text_size"])
+    else:
+        text_font = ImageFont.load_default()
+    icon_font = ImageFont.truetype(icon_font_file, spec["icon_size"]) if icon_font_file else None
+
+    # Background icon, drawn below the visible area when all plants have ok moisture,
+    # like build_openepaperlink_296x128_actions.py does
+    if "background_icon_x" in spec:
+        all_ok = all(plant["moisture_ok"] for plant in values)
+        x, y = spec["background_icon_x"], 180 if all_ok else 64
+        size = spec["background_icon_size"]
+        if icon_font_file:
+            background_font = ImageFont.truetype(icon_font_file, size)
+            icon = "thumb-up-outline" if all_ok else "thumb-down-outline"
+            draw.text((x, y), MDI_ICONS[icon], font=background_font, fill=RED, anchor="mm")
+        else:
+            draw.ellipse((x - size // 2, y - size // 2, x + size // 2, y + size // 2), outline=RED, width=3)
+
+    icon_size = spec["icon_size"]
+    for index, plant in enumerate(values):
+        y = spec["row_height"] * (index + 1)
+        icons = (("water" if plant["moisture_ok"] else "water-off", plant["moisture_ok"]),
+                 ("leaf" if plant["conductivity_ok"] else "leaf-off", plant["conductivity_ok"]))
+        for x, (icon, ok) in zip(spec["icon_x"], icons):
+            color = BLACK if ok else RED
+            if icon_font:
+                draw.text((x, y), MDI_ICONS[icon], font=icon_font, fill=color, anchor="ls")
+            else:
+                box = (x + 3, y - icon_size + 5, x + icon_size - 5, y - 3)
+                if icon.startswith("water"):
+                    draw.ellipse(box, outline=color, fill=None if ok else color)
+                else:
+                    draw.rectangle(box, outline=color, fill=None if ok else color)
+
+        text = f"{plant['name']} ({plant['moisture']}%/{plant['conductivity']})"
+        draw.text((spec["text_x"], y), text, font=text_font, fill=BLACK, anchor="lb" if text_font_file else None)
+
+    return image
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Main function for the script.
+    Renders an image for each area with a tag, and sends changed images to their tags.
+
+    Workflow:
+        1. Connects to the Home Assistant WebSocket API using credentials from my_secrets.
+        2. Retrieves plant information grouped by area, and all states in a single request.
+        3. Renders each tag image, unless an image with the same content hash is already cached.
+        4. Calls open_epaper_link.drawcustom with a dlimg payload element for tags whose image hash
+           differs from the one last sent.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+    tags = dict(tag.split("=", 1) for tag in args.tag)
+    sent_file = os.path.join(args.cache_dir, "sent.json")
+    os.makedirs(args.cache_dir, exist_ok=True)
+    sent: Dict[str, str] = {}
+    if os.path.exists(sent_file):
+        with open(sent_file, encoding="utf-8") as f:
+            sent = json.load(f)
+
+    profiler = create_profiler(args)
+    client = HomeAssistantWebSocketClient(my_secrets.HA_HOST, my_secrets.HA_PORT, my_secrets.HA_TOKEN)
+    client.profiler = profiler
+    profiler.start()
+    try:
+        await client.connect()
+
+        with profiler.phase("plant resolution"):
+            plants = await client.get_plants_sorted_on_area()
+            states = await client.get_states_dict()
+
+        for area_name, plant_entities in plants.items():
+            tag = tags.get(area_name)
+            if tag is None:
+                continue
+
+            values = get_plant_values(plant_entities, states)
+            digest = content_hash(args.layout, values)
+            file_name = f"{digest}.png"
+            path = os.path.join(args.cache_dir, file_name)
+            if not os.path.exists(path):
+                with profiler.phase("render"):
+                    image = render_image(args.layout, values, args.font, args.icon_font)
+                with profiler.phase("write"):
+                    image.save(path)
+
+            if sent.get(tag) == digest:
+                print(f"{area_name}: {tag} is up to date")
+                continue
+
+            with profiler.phase("upload"):
+                width, height = LAYOUTS[args.layout]["size"]
+                response = await client.call_service("open_epaper_link", "drawcustom", {
+                    "entity_id": tag,
+                    "background": "white",
+                    "rotate": 0,
+                    "dither": 0,
+                    "payload": [{
+                        "type": "dlimg",
+                        "url": f"{args.base_url.rstrip('/')}/{file_name}",
+                        "x": 0,
+                        "y": 0,
+                        "xsize": width,
+                        "ysize": height,
+                    }],
+                })
+            if response.get("success", False):
+                sent[tag] = digest
+                print(f"{area_name}: sent {file_name} to {tag}")
+            else:
+                print(f"{area_name}: failed to send {file_name} to {tag}: {response.get('error')}")
+
+        with open(sent_file, "w", encoding="utf-8") as f:
+            json.dump(sent, f, indent=2)
+
+        await client.close()
+    finally:
+        profiler.stop()
+        profiler.write_report(args.profile)
+
+
+if __name__ == "__main__":
+    """
+    Entry point for the script. Runs the main async logic.
+    """
+    parser = argparse.ArgumentParser(description="Render OpenEPaperLink plant tag images locally")
+    parser.add_argument("--tag", action="append", default=[], metavar="AREA=ENTITY_ID",
+                        help="Tag entity to show the plants of an area on, can be given multiple times")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="296x128", help="Tag layout")
+    parser.add_argument("--cache-dir", default="epaper", help="Image cache directory, served by Home Assistant")
+    parser.add_argument("--base-url", required=True, help="URL the cache directory is served from")
+    parser.add_argument("--font", help="TrueType font file for the text")
+    parser.add_argument("--icon-font", help="materialdesignicons-webfont.ttf for the status icons")
+    add_profile_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
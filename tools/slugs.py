@@ -0,0 +1,65 @@
+"""
+slugs.py
+
+Slug and label helpers shared by the builder scripts, for view paths, entity ids and titles derived
+from area names.
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional
+
+# Label of the plants without an area
+NO_AREA = "No area"
+
+
+def area_label(area_name: Optional[str]) -> str:
+    """
+    Returns the label shown for an area, NO_AREA for plants without an area.
+
+    Args:
+        area_name (Optional[str]): The area name, None for plants without an area.
+
+    Returns:
+        str: The label.
+    """
+    return area_name or NO_AREA
+
+
+def area_slug(area_name: Optional[str]) -> str:
+    """
+    Returns the slug Home Assistant uses for an area name, e.g. "Gästrum" becomes "gastrum".
+
+    Args:
+        area_name (Optional[str]): The area name, None for plants without an area.
+
+    Returns:
+        str: The slug.
+    """
+    ascii_name = unicodedata.normalize("NFKD", area_label(area_name)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "_", ascii_name.lower()).strip("_")
+
+
+def unique_area_slugs(area_names: Iterable[Optional[str]], reserved: Iterable[str] = ()) -> Dict[Optional[str], str]:
+    """
+    Returns a unique slug for each area name. Slugs that are reserved, or already used by another
+    area, get a numeric suffix, e.g. "plants_2".
+
+    Args:
+        area_names (Iterable[Optional[str]]): The area names.
+        reserved (Iterable[str]): Slugs that are already in use, e.g. the path of an overview view.
+
+    Returns:
+        Dict[Optional[str], str]: The slug of each area name.
+    """
+    used = set(reserved)
+    slugs = {}
+    for area_name in area_names:
+        slug = area_slug(area_name) or "area"
+        candidate = slug
+        suffix = 2
+        while candidate in used:
+            candidate = f"{slug}_{suffix}"
+            suffix += 1
+        used.add(candidate)
+        slugs[area_name] = candidate
+    return slugs